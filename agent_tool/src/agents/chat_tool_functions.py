@@ -1,15 +1,15 @@
+import asyncio
 from datetime import timedelta
-from typing import List
+from typing import List, Optional
 import json  # Ensure JSON serialization
 from pydantic import BaseModel
 from restack_ai.workflow import workflow, import_functions, log
 
 with import_functions():
-    from openai import pydantic_function_tool
     from src.functions.llm_chat import llm_chat, LlmChatInput, Message
-    from src.functions.lookup_sales import lookupSales, LookupSalesInput
-    from src.functions.recommend_products import recommend_products, RecommendationInput
-    # from src.functions.new_function import new_function, FunctionInput, FunctionOutput
+    # Tool schemas are built once when src.agents.tools is imported, register new tools there
+    from src.agents.tools import TOOLS, TOOL_PARAMS
+    from src.functions.tool_call_settings import tool_call_settings
 
 class MessageEvent(BaseModel):
     content: str
@@ -22,30 +22,13 @@ class AgentChatToolFunctions:
     def __init__(self) -> None:
         self.finished = False
         self.messages: List[Message] = []
+        # Recorded at the start of the run, see run()
+        self.max_parallel_tool_calls: Optional[int] = None
 
     @workflow.event
     async def message(self, message: MessageEvent) -> List[Message]:
         log.info(f"Received message: {message.content}")
 
-        # Define which tools are available
-        tools = [
-            pydantic_function_tool(
-                model=LookupSalesInput,
-                name=lookupSales.__name__,
-                description="Lookup sales for a given category"
-            ),
-            pydantic_function_tool(
-                model=RecommendationInput,
-                name=recommend_products.__name__,
-                description="Recommend products based on user preferences"
-            ),
-            # pydantic_function_tool(
-            #     model=FunctionInput,
-            #     name=new_function.__name__,
-            #     description="A function to talk to an ERP to get the latest sales data"
-            # )
-        ]
-
         # Your system instruction:
         system_content = (
             "You are a sales assistant with tool access. "
@@ -67,11 +50,11 @@ class AgentChatToolFunctions:
             Message(role="user", content=message.content or "")
         )
 
-        log.info(f"Calling llm_chat with tools: {tools}")
+        log.info(f"Calling llm_chat with tools: {list(TOOLS)}")
 
         completion = await workflow.step(
             llm_chat,
-            LlmChatInput(messages=self.messages, tools=tools),
+            LlmChatInput(messages=self.messages, tools=TOOL_PARAMS),
             start_to_close_timeout=timedelta(seconds=120),
         )
 
@@ -91,66 +74,16 @@ class AgentChatToolFunctions:
 
         # If the LLM decided to call any tool
         if tool_calls:
-            responses = []
-
-            for tool_call in tool_calls:
-                log.info(f"Processing tool_call: {tool_call}")
-                name = tool_call.function.name
-
-                match name:
-                    case lookupSales.__name__:
-                        try:
-                            args = LookupSalesInput.model_validate_json(tool_call.function.arguments)
-                            log.info(f"Calling {name} with args: {args}")
-
-                            result = await workflow.step(
-                                lookupSales,
-                                input=LookupSalesInput(category=args.category),
-                                start_to_close_timeout=timedelta(seconds=120)
-                            )
-
-                            # Ensure JSON serialization
-                            json_result = json.dumps(result.dict(), default=str)
-                            log.info(f"lookupSales result: {json_result}")
-
-                            responses.append(
-                                Message(role="tool", tool_call_id=tool_call.id, content=json_result)
-                            )
-
-                        except Exception as e:
-                            log.error(f"Error calling {name}: {e}")
-
-                    case recommend_products.__name__:
-                        try:
-                            raw_args = tool_call.function.arguments
-                            log.info(f"Raw recommend_products arguments: {raw_args}")
-
-                            # Ensure JSON parsing is robust
-                            if isinstance(raw_args, dict):
-                                args = RecommendationInput.parse_obj(raw_args)
-                            else:
-                                args = RecommendationInput.model_validate_json(raw_args)
-
-                        except Exception as e:
-                            log.error(f"Failed to parse RecommendationInput JSON: {e}")
-                            continue
-
-                        log.info(f"Calling {name} with args: {args}")
-                        result = await workflow.step(
-                            recommend_products,
-                            input=args,
-                            start_to_close_timeout=timedelta(seconds=120)
-                        )
-
-                        json_result = json.dumps(result.dict(), default=str)
-                        log.info(f"recommend_products result: {json_result}")
-
-                        responses.append(
-                            Message(role="tool", tool_call_id=tool_call.id, content=json_result)
-                        )
-
-                    # case new_function.__name__:
-                    #     ...
+            # Tool calls of one turn are independent, run them concurrently up to the cap
+            await workflow.condition(lambda: self.max_parallel_tool_calls is not None)
+            semaphore = asyncio.Semaphore(self.max_parallel_tool_calls)
+
+            async def call(tool_call) -> Message:
+                async with semaphore:
+                    return await self.call_tool(tool_call)
+
+            # gather keeps the tool_call order, a failed call still answers its tool_call_id
+            responses = await asyncio.gather(*(call(tool_call) for tool_call in tool_calls))
 
             # Now append all tool responses before calling llm_chat again
             self.messages.extend(responses)
@@ -171,6 +104,32 @@ class AgentChatToolFunctions:
 
         return self.messages
 
+    async def call_tool(self, tool_call) -> Message:
+        log.info(f"Processing tool_call: {tool_call}")
+        name = tool_call.function.name
+        try:
+            tool = TOOLS.get(name)
+            if tool is None:
+                raise ValueError(f"Unknown tool {name}")
+            args = tool.parse(tool_call.function.arguments)
+            log.info(f"Calling {name} with args: {args}")
+
+            result = await workflow.step(
+                tool.function,
+                input=args,
+                start_to_close_timeout=timedelta(seconds=120)
+            )
+
+            # Ensure JSON serialization
+            json_result = json.dumps(result.dict(), default=str)
+            log.info(f"{name} result: {json_result}")
+        except Exception as e:
+            log.error(f"Error calling {name}: {e}")
+            # The LLM expects an answer for every tool call, tell it this one failed
+            json_result = json.dumps({"error": f"{name} failed: {e}"})
+
+        return Message(role="tool", tool_call_id=tool_call.id, content=json_result)
+
     @workflow.event
     async def end(self, end: EndEvent) -> EndEvent:
         log.info("Received end")
@@ -179,5 +138,9 @@ class AgentChatToolFunctions:
 
     @workflow.run
     async def run(self, input: dict):
+        # The cap decides how many steps a turn schedules at once. It comes from a step,
+        # so it is part of the history and a redeploy with another value cannot break replay.
+        settings = await workflow.step(tool_call_settings, start_to_close_timeout=timedelta(seconds=10))
+        self.max_parallel_tool_calls = settings.max_parallel_tool_calls
         await workflow.condition(lambda: self.finished)
         return
@@ -0,0 +1,63 @@
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Type, Union
+
+from openai import pydantic_function_tool
+from openai.types.chat.chat_completion_tool_param import ChatCompletionToolParam
+from pydantic import BaseModel
+
+from src.functions.lookup_sales import lookupSales, LookupSalesInput
+from src.functions.recommend_products import recommend_products, RecommendationInput
+# Step 5: Import a new function to tool calling here
+# from src.functions.new_function import new_function, FunctionInput, FunctionOutput
+
+# Most tool calls of one assistant turn that run at the same time
+MAX_PARALLEL_TOOL_CALLS = int(os.getenv("MAX_PARALLEL_TOOL_CALLS", "4"))
+if MAX_PARALLEL_TOOL_CALLS < 1:
+    # A semaphore of 0 would wait forever, reject it when the service starts
+    raise ValueError(f"MAX_PARALLEL_TOOL_CALLS must be at least 1, got {MAX_PARALLEL_TOOL_CALLS}")
+
+
+@dataclass(frozen=True)
+class Tool:
+    name: str
+    function: Callable[..., Any]
+    input_model: Type[BaseModel]
+    # Built once when the tool is registered, JSON schema generation included
+    param: ChatCompletionToolParam
+
+    def parse(self, arguments: Union[str, Dict[str, Any]]) -> BaseModel:
+        # The model's compiled validator, built with the model class
+        if isinstance(arguments, dict):
+            return self.input_model.model_validate(arguments)
+        return self.input_model.model_validate_json(arguments)
+
+
+TOOLS: Dict[str, Tool] = {}
+
+
+def register(function: Callable[..., Any], input_model: Type[BaseModel], description: str) -> Tool:
+    name = function.__name__
+    if name in TOOLS:
+        raise ValueError(f"Tool {name} is already registered")
+    TOOLS[name] = Tool(
+        name=name,
+        function=function,
+        input_model=input_model,
+        param=pydantic_function_tool(model=input_model, name=name, description=description),
+    )
+    return TOOLS[name]
+
+
+register(lookupSales, LookupSalesInput, "Lookup sales for a given category")
+register(recommend_products, RecommendationInput, "Recommend products based on user preferences")
+# Step 6: Register your new function as a tool
+# register(new_function, FunctionInput, "A function to talk to an ERP to get the latest sales data")
+
+# Passed as `tools=` on every turn, never rebuilt
+TOOL_PARAMS: List[ChatCompletionToolParam] = [tool.param for tool in TOOLS.values()]
+
+
+def tool_functions() -> List[Callable[..., Any]]:
+    """Functions behind the registered tools, for the service functions list."""
+    return [tool.function for tool in TOOLS.values()]
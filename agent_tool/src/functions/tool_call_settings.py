@@ -0,0 +1,14 @@
+from restack_ai.function import function, log
+from pydantic import BaseModel
+
+from src.agents.tools import MAX_PARALLEL_TOOL_CALLS
+
+class ToolCallSettings(BaseModel):
+    max_parallel_tool_calls: int
+
+@function.defn()
+async def tool_call_settings() -> ToolCallSettings:
+    # Read from the worker environment once per workflow run, the result is kept in the
+    # run's history so replays on a worker with another setting still use this one
+    log.info("tool_call_settings", max_parallel_tool_calls=MAX_PARALLEL_TOOL_CALLS)
+    return ToolCallSettings(max_parallel_tool_calls=MAX_PARALLEL_TOOL_CALLS)
@@ -3,20 +3,19 @@ import os
 from watchfiles import run_process
 import webbrowser
 from src.client import client
-from src.functions.lookup_sales import lookupSales
 from src.functions.llm_chat import llm_chat
+from src.functions.tool_call_settings import tool_call_settings
 
 from src.agents.chat_tool_functions import AgentChatToolFunctions
-from src.functions.recommend_products import recommend_products
-# Step 5: Import a new function to tool calling here
-# from src.functions.new_function import new_function, FunctionInput, FunctionOutput
+# New functions for tool calling are registered in src/agents/tools.py
+from src.agents.tools import tool_functions
 
 async def main():
 
     await client.start_service(
         workflows=[AgentChatToolFunctions],
-        ## Step 6: Add your new function to the functions list -> functions=[lookupSales, llm_chat, new_function]
-        functions=[lookupSales, llm_chat, recommend_products]
+        # Every registered tool is served, no need to list new functions here
+        functions=[llm_chat, tool_call_settings, *tool_functions()]
     )
 
 def run_services():
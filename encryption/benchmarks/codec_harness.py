@@ -0,0 +1,244 @@
+"""Codec benchmark: in-process and through the codec server over loopback.
+
+For every payload size mix it reports ops/s, MB/s, p50/p99 latency and CPU
+seconds per MB of encode and decode, as JSON to track regressions across
+releases. Run from the encryption folder:
+
+    poetry run python -m benchmarks.codec_harness --output codec-harness.json
+
+The server runs in a separate process on 127.0.0.1, its decode cache is off
+unless --server-cache is given so repeated payloads measure real decodes.
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import sys
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from restack_ai.security import Payloads
+
+from src.codec_chain import default_codec
+
+from .codec_throughput import make_payloads
+
+KB = 1024
+MB = 1024 * KB
+
+# Payload size of every mix
+MIXES = {
+    "tiny": 16,
+    "1kb": KB,
+    "100kb": 100 * KB,
+    "10mb": 10 * MB,
+}
+# Operations per case are capped by count and by total bytes moved
+MAX_OPS = 2000
+MAX_BYTES = 512 * MB
+
+
+def _process_cpu_seconds(pid: int) -> Optional[float]:
+    # utime + stime of another process, Linux only
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    # Nearest rank, exact for the p99 of a few hundred samples
+    return sorted_values[max(0, math.ceil(q / 100 * len(sorted_values)) - 1)]
+
+
+def _summary(latencies: List[float], wall: float, cpu: Optional[float], total_bytes: int) -> Dict[str, Any]:
+    mb = total_bytes / MB
+    latencies = sorted(latencies)
+    return {
+        "ops": len(latencies),
+        "ops_per_second": round(len(latencies) / wall, 1),
+        "mb_per_second": round(mb / wall, 2),
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50) * 1000, 3),
+            "p99": round(_percentile(latencies, 99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3),
+        },
+        "cpu_seconds_per_mb": round(cpu / mb, 4) if cpu is not None and mb else None,
+    }
+
+
+async def _drive(
+    op: Callable[[], Awaitable[Any]], ops: int, concurrency: int, cpu: Callable[[], Optional[float]], total_bytes: int
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    remaining = iter(range(ops))
+
+    async def worker() -> None:
+        for _ in remaining:
+            started = time.perf_counter()
+            await op()
+            latencies.append(time.perf_counter() - started)
+
+    cpu_before = cpu()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    cpu_after = cpu()
+    used = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else None
+    return _summary(latencies, wall, used, total_bytes)
+
+
+def _serve(port: int, cache: bool) -> None:
+    if not cache:
+        os.environ["CODEC_DECODE_CACHE_BYTES"] = "0"
+    # Imported here so the environment above applies to the server modules
+    from aiohttp import web
+
+    from src.codec_server import build_codec_server
+
+    web.run_app(build_codec_server(), host="127.0.0.1", port=port, print=None)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _wait_for_port(port: int, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    codec = default_codec()
+    results: List[Dict[str, Any]] = []
+
+    server = session = None
+    if args.server:
+        import aiohttp
+
+        port = _free_port()
+        server = multiprocessing.get_context("spawn").Process(target=_serve, args=(port, args.server_cache), daemon=True)
+        server.start()
+        await _wait_for_port(port)
+        session = aiohttp.ClientSession(base_url=f"http://127.0.0.1:{port}")
+
+    try:
+        for name in args.mixes:
+            size = MIXES[name]
+            payloads = make_payloads([size] * args.payloads_per_op, args.content, random.Random(args.seed))
+            encoded = await codec.encode(payloads)
+            op_bytes = size * args.payloads_per_op
+            ops = max(10, min(MAX_OPS, MAX_BYTES // op_bytes))
+
+            cases: Dict[str, Callable[[], Awaitable[Any]]] = {
+                "in_process.encode": lambda: codec.encode(payloads),
+                "in_process.decode": lambda: codec.decode(encoded),
+            }
+            if session is not None:
+                content_type = "application/x-protobuf" if args.server_format == "protobuf" else "application/json"
+                bodies = {
+                    "encode": Payloads(payloads=payloads),
+                    "decode": Payloads(payloads=encoded),
+                }
+
+                def serialise(message: Payloads) -> bytes:
+                    if content_type == "application/json":
+                        from google.protobuf import json_format
+
+                        return json_format.MessageToJson(message).encode()
+                    return message.SerializeToString()
+
+                serialised = {route: serialise(message) for route, message in bodies.items()}
+
+                def post(route: str) -> Callable[[], Awaitable[Any]]:
+                    async def call() -> None:
+                        async with session.post(
+                            f"/{route}", data=serialised[route], headers={"Content-Type": content_type, "Accept": content_type}
+                        ) as resp:
+                            resp.raise_for_status()
+                            await resp.read()
+                    return call
+
+                cases["server.encode"] = post("encode")
+                cases["server.decode"] = post("decode")
+
+            for case, op in cases.items():
+                target, operation = case.split(".")
+                if target == "in_process":
+                    cpu = time.process_time
+                    concurrency = 1
+                else:
+                    pid = server.pid
+                    cpu = lambda: _process_cpu_seconds(pid)
+                    concurrency = args.concurrency
+                result = {
+                    "mix": name,
+                    "payload_bytes": size,
+                    "payloads_per_op": args.payloads_per_op,
+                    "target": target,
+                    "operation": operation,
+                    "concurrency": concurrency,
+                }
+                try:
+                    # Warm up connection pools, thread pools and caches before timing
+                    for _ in range(min(5, ops)):
+                        await op()
+                    result.update(await _drive(op, ops, concurrency, cpu, op_bytes * ops))
+                except Exception as e:
+                    # One failing case, e.g. a 413 from the server, must not lose the rest of the report
+                    result["error"] = f"{type(e).__name__}: {e}"
+                results.append(result)
+                print(json.dumps(result), file=sys.stderr, flush=True)
+    finally:
+        if session is not None:
+            await session.close()
+        if server is not None:
+            server.terminate()
+            server.join()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mixes", nargs="+", default=list(MIXES), choices=list(MIXES))
+    parser.add_argument("--payloads-per-op", type=int, default=1)
+    parser.add_argument("--content", default="json", choices=["json", "random"])
+    parser.add_argument("--server", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--server-format", default="protobuf", choices=["protobuf", "json"])
+    parser.add_argument("--server-cache", action="store_true")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight against the server")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {
+        "config": vars(args),
+        "environment": {key: value for key, value in os.environ.items() if key.startswith("CODEC_")},
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "results": asyncio.run(run(args)),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""EncryptionCodec throughput and event loop stalls across payload size mixes.
+
+Runs in-process, no Restack engine needed. Run from the encryption folder:
+
+    poetry run python -m benchmarks.codec_throughput --output codec.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+from restack_ai.security import Payload
+
+from src.codec import CODEC_MAX_WORKERS, PARALLEL_MIN_BYTES, EncryptionCodec
+from src.compression import ALGORITHMS, Compression
+
+KB = 1024
+MB = 1024 * KB
+
+# Payload sizes of one encode call for every mix
+MIXES = {
+    "small": lambda rng: [rng.randint(100, 4 * KB) for _ in range(256)],
+    "mixed": lambda rng: [rng.randint(100, 4 * KB) for _ in range(240)] + [rng.randint(1 * MB, 8 * MB) for _ in range(16)],
+    "large": lambda rng: [4 * MB] * 16,
+    "huge": lambda rng: [32 * MB] * 4,
+}
+
+
+def _json_like(size: int, rng: random.Random) -> bytes:
+    # Repetitive keys and a small vocabulary, roughly how LLM results and JSON compress
+    words = ["the", "workflow", "result", "summary", "customer", "order", "amount", "status", "2024", "true"]
+    record = json.dumps({"id": rng.randint(0, 10**6), "text": " ".join(rng.choice(words) for _ in range(40))})
+    return (record * (size // len(record) + 1)).encode()[:size]
+
+
+def make_payloads(sizes: List[int], content: str, rng: random.Random) -> List[Payload]:
+    if content == "random":
+        return [Payload(metadata={"encoding": b"json/plain"}, data=os.urandom(size)) for size in sizes]
+    return [Payload(metadata={"encoding": b"json/plain"}, data=_json_like(size, rng)) for size in sizes]
+
+
+async def _loop_lag(stop: asyncio.Event, interval: float = 0.001) -> float:
+    # Longest time the loop could not run this ticker, i.e. how long the codec blocked it
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - started - interval)
+    return worst
+
+
+async def _timed(fn, payloads: List[Payload], repeat: int) -> Dict[str, float]:
+    seconds: List[float] = []
+    lags: List[float] = []
+    for _ in range(repeat):
+        stop = asyncio.Event()
+        ticker = asyncio.create_task(_loop_lag(stop))
+        await asyncio.sleep(0)
+        started = time.perf_counter()
+        await fn(payloads)
+        seconds.append(time.perf_counter() - started)
+        stop.set()
+        lags.append(await ticker)
+    return {"seconds": min(seconds), "max_loop_stall_ms": max(lags) * 1000}
+
+
+async def run_mix(
+    name: str, payloads: List[Payload], codec: EncryptionCodec, mode: str, repeat: int
+) -> Dict[str, Any]:
+    total_mb = sum(len(p.data) for p in payloads) / MB
+    encoded = await codec.encode(payloads)
+    decoded = await codec.decode(encoded)
+    assert [p.data for p in decoded] == [p.data for p in payloads], "round trip changed the payloads"
+
+    encode = await _timed(codec.encode, payloads, repeat)
+    decode = await _timed(codec.decode, encoded, repeat)
+    return {
+        "mix": name,
+        "mode": mode,
+        "payloads": len(payloads),
+        "total_mb": round(total_mb, 2),
+        "stored_mb": round(sum(len(p.data) for p in encoded) / MB, 2),
+        "encode_mb_per_s": round(total_mb / encode["seconds"], 1),
+        "decode_mb_per_s": round(total_mb / decode["seconds"], 1),
+        "encode_max_loop_stall_ms": round(encode["max_loop_stall_ms"], 2),
+        "decode_max_loop_stall_ms": round(decode["max_loop_stall_ms"], 2),
+    }
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    compression = Compression(args.compression, args.compression_level)
+    codecs = {
+        "inline": EncryptionCodec(parallel_min_bytes=sys.maxsize, compression=compression),
+        "pooled": EncryptionCodec(parallel_min_bytes=args.parallel_min_bytes, compression=compression),
+    }
+    results = []
+    for name in args.mixes:
+        rng = random.Random(args.seed)
+        payloads = make_payloads(MIXES[name](rng), args.content, rng)
+        for mode, codec in codecs.items():
+            results.append(await run_mix(name, payloads, codec, mode, args.repeat))
+            print(json.dumps(results[-1]), file=sys.stderr, flush=True)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mixes", nargs="+", default=list(MIXES), choices=list(MIXES))
+    parser.add_argument("--parallel-min-bytes", type=int, default=PARALLEL_MIN_BYTES)
+    parser.add_argument("--content", default="json", choices=["json", "random"])
+    parser.add_argument("--compression", default="none", choices=ALGORITHMS)
+    parser.add_argument("--compression-level", type=int)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {
+        "config": {**vars(args), "max_workers": CODEC_MAX_WORKERS},
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "results": asyncio.run(run(args)),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
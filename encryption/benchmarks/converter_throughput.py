@@ -0,0 +1,212 @@
+"""Default vs orjson payload converter on the message shapes our examples send.
+
+Runs in-process, no Restack engine needed. Run from the encryption folder:
+
+    poetry run python -m benchmarks.converter_throughput --output converter.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel
+from restack_ai.security import converter
+
+from src.payload_converter import OrjsonPayloadConverter
+
+
+# Shapes of agent_tool: chat history with tool calls, and function results
+class ToolCallFunction(BaseModel):
+    name: str
+    arguments: str
+
+
+class ToolCall(BaseModel):
+    id: str
+    type: Literal["function"] = "function"
+    function: ToolCallFunction
+
+
+class Message(BaseModel):
+    role: Literal["system", "user", "assistant", "tool"]
+    content: str
+    tool_call_id: Optional[str] = None
+    tool_calls: Optional[List[ToolCall]] = None
+
+
+class LlmChatInput(BaseModel):
+    system_content: Optional[str] = None
+    model: Optional[str] = None
+    messages: Optional[List[Message]] = None
+    tools: Optional[List[Dict[str, Any]]] = None
+
+
+class SalesItem(BaseModel):
+    item_id: int
+    type: str
+    name: str
+    retail_price_usd: float
+    sale_price_usd: float
+    sale_discount_pct: int
+
+
+class LookupSalesOutput(BaseModel):
+    sales: List[SalesItem]
+
+
+# Shape of pdf_ocr: per-page OCR results
+@dataclass
+class PageResult:
+    page: int
+    text: str
+    confidence: float
+    processed_at: datetime
+
+
+WORDS = ["the", "workflow", "result", "summary", "customer", "order", "amount", "status", "snowboard", "boots"]
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _tool(name: str) -> Dict[str, Any]:
+    return {
+        "type": "function",
+        "function": {
+            "name": name,
+            "description": f"Run {name}",
+            "parameters": {
+                "type": "object",
+                "properties": {"category": {"type": "string", "enum": ["snowboard", "apparel", "boots", "any"]}},
+                "required": ["category"],
+            },
+        },
+    }
+
+
+def chat_input(rng: random.Random, turns: int) -> LlmChatInput:
+    messages = [Message(role="system", content=_text(rng, 60))]
+    for turn in range(turns):
+        messages.append(Message(role="user", content=_text(rng, 30)))
+        call = ToolCall(id=f"call_{turn}", function=ToolCallFunction(name="lookupSales", arguments='{"category": "boots"}'))
+        messages.append(Message(role="assistant", content="", tool_calls=[call]))
+        messages.append(Message(role="tool", content=_text(rng, 200), tool_call_id=call.id))
+        messages.append(Message(role="assistant", content=_text(rng, 80)))
+    return LlmChatInput(model="restack-c1", messages=messages, tools=[_tool("lookupSales"), _tool("recommend_products")])
+
+
+def sales(rng: random.Random, items: int) -> LookupSalesOutput:
+    return LookupSalesOutput(
+        sales=[
+            SalesItem(
+                item_id=i,
+                type=rng.choice(["snowboard", "apparel", "boots", "accessories"]),
+                name=_text(rng, 4),
+                retail_price_usd=round(rng.uniform(20, 800), 2),
+                sale_price_usd=round(rng.uniform(10, 600), 2),
+                sale_discount_pct=rng.randint(5, 60),
+            )
+            for i in range(items)
+        ]
+    )
+
+
+def pages(rng: random.Random, count: int) -> List[PageResult]:
+    now = datetime.now(timezone.utc)
+    return [PageResult(page=i, text=_text(rng, 400), confidence=rng.random(), processed_at=now) for i in range(count)]
+
+
+def completion(rng: random.Random, choices: int) -> Dict[str, Any]:
+    # Untyped LLM response dicts, decoded without a type hint
+    return {
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 1700000000,
+        "model": "restack-c1",
+        "choices": [
+            {"index": i, "finish_reason": "stop", "message": {"role": "assistant", "content": _text(rng, 300)}}
+            for i in range(choices)
+        ],
+        "usage": {"prompt_tokens": 1200, "completion_tokens": 300 * choices, "total_tokens": 1200 + 300 * choices},
+    }
+
+
+# name -> (value factory, type hint used to decode)
+SHAPES: Dict[str, Tuple[Callable[[random.Random], Any], Any]] = {
+    "chat_input_short": (lambda rng: chat_input(rng, 2), LlmChatInput),
+    "chat_input_long": (lambda rng: chat_input(rng, 40), LlmChatInput),
+    "lookup_sales": (lambda rng: sales(rng, 200), LookupSalesOutput),
+    "ocr_pages": (lambda rng: pages(rng, 50), List[PageResult]),
+    "completion_dict": (lambda rng: completion(rng, 4), None),
+    "small_string": (lambda rng: "Hello, world!", str),
+}
+
+
+def _best(fn: Callable[[], Any], number: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - started) / number)
+    return best
+
+
+def run_shape(name: str, value: Any, type_hint: Any, converters: Dict[str, Any], args: argparse.Namespace) -> Dict[str, Any]:
+    result: Dict[str, Any] = {"shape": name}
+    hints = [type_hint] if type_hint is not None else None
+    for label, payload_converter in converters.items():
+        try:
+            payloads = payload_converter.to_payloads([value])
+            payload_converter.from_payloads(payloads, hints)
+        except Exception as e:
+            # The default converter does not handle every shape, report it instead of failing the run
+            result[f"{label}_error"] = f"{type(e).__name__}: {e}"
+            continue
+        encode = _best(lambda: payload_converter.to_payloads([value]), args.number, args.repeat)
+        decode = _best(lambda: payload_converter.from_payloads(payloads, hints), args.number, args.repeat)
+        result[f"{label}_bytes"] = len(payloads[0].data)
+        result[f"{label}_encode_us"] = round(encode * 1e6, 1)
+        result[f"{label}_decode_us"] = round(decode * 1e6, 1)
+    if "default_encode_us" in result and "orjson_encode_us" in result:
+        result["encode_speedup"] = round(result["default_encode_us"] / result["orjson_encode_us"], 2)
+        result["decode_speedup"] = round(result["default_decode_us"] / result["orjson_decode_us"], 2)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shapes", nargs="+", default=list(SHAPES), choices=list(SHAPES))
+    parser.add_argument("--number", type=int, default=200, help="Calls per timing")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    converters = {"default": converter.default().payload_converter, "orjson": OrjsonPayloadConverter()}
+    results = []
+    for name in args.shapes:
+        factory, type_hint = SHAPES[name]
+        results.append(run_shape(name, factory(random.Random(args.seed)), type_hint, converters, args))
+        print(json.dumps(results[-1]), file=sys.stderr, flush=True)
+
+    report = {
+        "config": vars(args),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Peak memory of single-shot versus segmented encryption of large payloads.
+
+Run from the encryption folder:
+
+    poetry run python -m benchmarks.segmented_memory --sizes-mb 16 64 256
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict
+
+from restack_ai.security import Payload
+
+from src.codec import EncryptionCodec
+from src.keyring import Keyring
+from src.segmented import decrypt_stream, encrypt_stream
+
+MB = 1024 * 1024
+
+
+def _measure(fn: Callable[..., Any], *args: Any) -> Dict[str, float]:
+    # Only allocations made while `fn` runs are traced, data prepared beforehand does not count
+    tracemalloc.start()
+    started = time.perf_counter()
+    fn(*args)
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": round(seconds, 3), "peak_mb": round(peak / MB, 1)}
+
+
+def run_size(size_mb: int, segment_bytes: int) -> Dict[str, Any]:
+    keyring = Keyring({"bench": os.urandom(32)}, "bench")
+    single = EncryptionCodec(keyring=keyring, segmented_min_bytes=2**62)
+    segmented = EncryptionCodec(keyring=keyring, segmented_min_bytes=0, segment_bytes=segment_bytes)
+    payload = Payload(metadata={"encoding": b"binary/plain"}, data=os.urandom(size_mb * MB))
+
+    result: Dict[str, Any] = {"size_mb": size_mb}
+    for name, codec in (("single_shot", single), ("segmented", segmented)):
+        keys = keyring.snapshot()
+        encoded = codec._encode_one(keys, None, payload)
+        result[f"{name}_encode"] = _measure(codec._encode_one, keys, None, payload)
+        result[f"{name}_decode"] = _measure(codec._decode_one, keys, encoded)
+
+    # File to file, the payload never has to fit in memory
+    key = keyring.snapshot().active_key
+    with tempfile.TemporaryDirectory() as tmp:
+        plain, sealed, restored = (os.path.join(tmp, name) for name in ("plain", "sealed", "restored"))
+        with open(plain, "wb") as f:
+            f.write(payload.data)
+
+        def encrypt_file() -> None:
+            with open(plain, "rb") as reader, open(sealed, "wb") as writer:
+                encrypt_stream(key, reader, writer, segment_bytes)
+
+        def decrypt_file() -> None:
+            with open(sealed, "rb") as reader, open(restored, "wb") as writer:
+                decrypt_stream(key, reader, writer)
+
+        result["stream_encrypt"] = _measure(encrypt_file)
+        result["stream_decrypt"] = _measure(decrypt_file)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--segment-bytes", type=int, default=MB)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {"config": vars(args), "results": [run_size(size, args.segment_bytes) for size in args.sizes_mb]}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from restack_ai.security import Payload, PayloadCodec
+
+from .codec import codec_executor
+from .keyring import Keyring
+
+# Payloads at least this large are moved to the blob store, only a reference goes to the engine
+CODEC_CLAIM_CHECK = os.getenv("CODEC_CLAIM_CHECK", "false").lower() == "true"
+CODEC_CLAIM_CHECK_MIN_BYTES = int(os.getenv("CODEC_CLAIM_CHECK_MIN_BYTES", str(128 * 1024)))
+CODEC_BLOB_DIR = os.getenv("CODEC_BLOB_DIR", ".blobs")
+
+
+class BlobStore(ABC):
+    """Content-addressed storage: blobs are written and read by a sha256 digest."""
+
+    @abstractmethod
+    def put(self, digest: str, data: bytes) -> bool:
+        """Store `data` under `digest`. Returns False when the blob was already there."""
+
+    @abstractmethod
+    def get(self, digest: str) -> bytes:
+        """Blob content, KeyError when it is missing."""
+
+    @abstractmethod
+    def delete(self, digest: str) -> None: ...
+
+    @abstractmethod
+    def digests(self) -> Iterator[str]: ...
+
+    def gc(self, is_referenced: Callable[[str], bool], older_than_seconds: float = 0) -> List[str]:
+        """Delete blobs no longer referenced by any history. Returns the deleted digests.
+
+        Stores that track blob age skip blobs written or reused in the last
+        `older_than_seconds`, so a payload encoded during the sweep is never lost.
+        """
+        deleted = [digest for digest in self.digests() if not is_referenced(digest)]
+        for digest in deleted:
+            self.delete(digest)
+        return deleted
+
+
+class LocalBlobStore(BlobStore):
+    """Blobs as files under `root`, fanned out by the first two digest characters."""
+
+    def __init__(self, root: str = CODEC_BLOB_DIR) -> None:
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+            raise ValueError(f"Invalid blob digest {digest!r}")
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, digest: str, data: bytes) -> bool:
+        path = self._path(digest)
+        if os.path.exists(path):
+            # Same content is stored once, refresh its age so gc keeps it
+            os.utime(path)
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write aside and rename so readers never see a partial blob
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return True
+
+    def get(self, digest: str) -> bytes:
+        try:
+            with open(self._path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(digest) from None
+
+    def delete(self, digest: str) -> None:
+        try:
+            os.unlink(self._path(digest))
+        except FileNotFoundError:
+            pass
+
+    def digests(self) -> Iterator[str]:
+        for fan_out in os.scandir(self.root):
+            if fan_out.is_dir():
+                for entry in os.scandir(fan_out.path):
+                    if not entry.name.startswith(".tmp-"):
+                        yield entry.name
+
+    def gc(self, is_referenced: Callable[[str], bool], older_than_seconds: float = 0) -> List[str]:
+        cutoff = time.time() - older_than_seconds
+        deleted = []
+        for digest in list(self.digests()):
+            path = self._path(digest)
+            try:
+                if os.stat(path).st_mtime > cutoff or is_referenced(digest):
+                    continue
+            except FileNotFoundError:
+                continue
+            self.delete(digest)
+            deleted.append(digest)
+        return deleted
+
+
+def _address(p: Payload, key: Optional[bytes]) -> str:
+    # Deterministic serialisation, equal payloads get equal addresses whatever their map order
+    data = p.SerializeToString(deterministic=True)
+    if key is None:
+        return hashlib.sha256(data).hexdigest()
+    # Keyed, so reading the store does not confirm a guessed payload, and separate from the
+    # encryption key itself
+    address_key = hmac.new(key, b"claim-check-address", hashlib.sha256).digest()
+    return hmac.new(address_key, data, hashlib.sha256).hexdigest()
+
+
+class ClaimCheckCodec(PayloadCodec):
+    """Moves large payloads to a blob store and leaves a small reference in history.
+
+    Blobs are stored as encoded by `blob_codec`, so they are encrypted at rest, under
+    an HMAC of the plaintext payload keyed by the key that encrypted them. Identical
+    payloads share one blob until the active key rotates, then the next encode writes
+    a new blob under the new key. Run it before the encryption codec, which then
+    encrypts the reference too.
+    """
+
+    def __init__(
+        self,
+        store: Optional[BlobStore] = None,
+        min_bytes: int = CODEC_CLAIM_CHECK_MIN_BYTES,
+        blob_codec: Optional[PayloadCodec] = None,
+        keyring: Optional[Keyring] = None,
+    ) -> None:
+        super().__init__()
+        self.store = store or LocalBlobStore()
+        self.min_bytes = min_bytes
+        self.blob_codec = blob_codec
+        # Keys blob addresses, without it blobs are addressed by a plain sha256
+        self.keyring = keyring
+        # Updated from codec pool threads
+        self._stats_lock = threading.Lock()
+        self.stats: Dict[str, int] = {"stored": 0, "deduplicated": 0, "offloaded_bytes": 0}
+
+    async def encode(self, payloads: Iterable[Payload]) -> List[Payload]:
+        payloads = list(payloads)
+        selected = [i for i, p in enumerate(payloads) if p.ByteSize() >= self.min_bytes]
+        if not selected:
+            return payloads
+        blobs = [payloads[i] for i in selected]
+        if self.blob_codec is not None:
+            blobs = await self.blob_codec.encode(blobs)
+        # Hashing and blob IO go to the codec pool, other payloads pass through untouched
+        loop = asyncio.get_running_loop()
+        references = await asyncio.gather(
+            *(
+                loop.run_in_executor(codec_executor(), self._store, payloads[i], blob)
+                for i, blob in zip(selected, blobs)
+            )
+        )
+        ret = list(payloads)
+        for i, reference in zip(selected, references):
+            ret[i] = reference
+        return ret
+
+    async def decode(self, payloads: Iterable[Payload]) -> List[Payload]:
+        payloads = list(payloads)
+        selected = [i for i, p in enumerate(payloads) if p.metadata.get("encoding", b"") == b"binary/claim-check"]
+        if not selected:
+            return payloads
+        loop = asyncio.get_running_loop()
+        blobs = await asyncio.gather(*(loop.run_in_executor(codec_executor(), self._fetch, payloads[i]) for i in selected))
+        if self.blob_codec is not None:
+            blobs = await self.blob_codec.decode(blobs)
+        await asyncio.gather(
+            *(loop.run_in_executor(codec_executor(), self._verify, payloads[i], blob) for i, blob in zip(selected, blobs))
+        )
+        ret = list(payloads)
+        for i, blob in zip(selected, blobs):
+            ret[i] = blob
+        return ret
+
+    def _address_key(self, key_id: str) -> Optional[bytes]:
+        if self.keyring is None or not key_id:
+            return None
+        key = self.keyring.snapshot().keys.get(key_id)
+        if key is None:
+            raise ValueError(f"Unrecognized key ID {key_id} for a claim-checked payload")
+        return key
+
+    def _store(self, p: Payload, blob: Payload) -> Payload:
+        # The key that encrypted the blob also keys its address, a blob written under a
+        # retired key is never reused for a payload encoded after the rotation
+        key_id = blob.metadata.get("encryption-key-id", b"").decode() if self.keyring is not None else ""
+        digest = _address(p, self._address_key(key_id))
+        data = blob.SerializeToString()
+        stored = self.store.put(digest, data)
+        with self._stats_lock:
+            if stored:
+                self.stats["stored"] += 1
+                self.stats["offloaded_bytes"] += len(data)
+            else:
+                self.stats["deduplicated"] += 1
+        metadata = {
+            "encoding": b"binary/claim-check",
+            "claim-check-digest": digest.encode(),
+            "claim-check-digest-of": b"plaintext",
+            "claim-check-size": str(len(data)).encode(),
+        }
+        if key_id:
+            metadata["claim-check-key-id"] = key_id.encode()
+        return Payload(metadata=metadata, data=b"")
+
+    def _fetch(self, p: Payload) -> Payload:
+        digest = p.metadata["claim-check-digest"].decode()
+        try:
+            data = self.store.get(digest)
+        except KeyError:
+            raise ValueError(f"Claim-checked payload {digest} is missing from the blob store") from None
+        if "claim-check-digest-of" not in p.metadata and hashlib.sha256(data).hexdigest() != digest:
+            # References written before plaintext digests hash the stored blob itself
+            raise ValueError(f"Claim-checked payload {digest} does not match its digest")
+        return Payload.FromString(data)
+
+    def _verify(self, p: Payload, decoded: Payload) -> None:
+        # The address doubles as an integrity check on the decoded blob
+        digest = p.metadata["claim-check-digest"].decode()
+        if p.metadata.get("claim-check-digest-of") != b"plaintext":
+            return
+        key = self._address_key(p.metadata.get("claim-check-key-id", b"").decode())
+        if not hmac.compare_digest(_address(decoded, key), digest):
+            raise ValueError(f"Claim-checked payload {digest} does not match its digest")
+
+
+def referenced_digests(payloads: Iterable[Payload]) -> Iterator[str]:
+    """Digests referenced by payloads, to build the `is_referenced` set for gc.
+
+    References are encrypted in history, pass payloads decoded by the encryption codec.
+    """
+    for p in payloads:
+        if p.metadata.get("encoding", b"") == b"binary/claim-check":
+            yield p.metadata["claim-check-digest"].decode()
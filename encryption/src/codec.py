@@ -1,56 +1,171 @@
+import asyncio
 import os
-from typing import Iterable, List
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from restack_ai.security import Payload, PayloadCodec
 
+from .compression import Compression, decompress
+from .envelope import CODEC_ENVELOPE, DataKeys
+from .keyring import CODEC_KEYRING_PATH, Keyring, KeyringSnapshot
+from .segmented import CODEC_SEGMENT_BYTES, open_sealed, seal
+
 default_key = b"test-key-test-key-test-key-test!"
 default_key_id = "test-key-id"
 
+# Payloads at least this large are encrypted and decrypted on the codec thread pool,
+# smaller ones stay on the event loop where a thread hop would cost more than it saves
+PARALLEL_MIN_BYTES = int(os.getenv("CODEC_PARALLEL_MIN_BYTES", str(256 * 1024)))
+# AES-GCM in cryptography releases the GIL, so threads encrypt in parallel
+CODEC_MAX_WORKERS = int(os.getenv("CODEC_MAX_WORKERS", str(min(8, os.cpu_count() or 1))))
+# Payloads at least this large are sealed in segments (see segmented.py) instead of one
+# AES-GCM call, which avoids the full-size nonce + ciphertext concatenation copies
+SEGMENTED_MIN_BYTES = int(os.getenv("CODEC_SEGMENTED_MIN_BYTES", str(4 * 1024 * 1024)))
+# The format version itself is in the segmented header, see segmented.py
+SEGMENTED = b"segmented-v1"
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def default_keyring(key_id: str = default_key_id, key: bytes = default_key) -> Keyring:
+    """The key file at CODEC_KEYRING_PATH when set, otherwise the single given key."""
+    return Keyring.from_file(CODEC_KEYRING_PATH) if CODEC_KEYRING_PATH else Keyring({key_id: key}, key_id)
+
+
+def codec_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=CODEC_MAX_WORKERS, thread_name_prefix="codec")
+    return _executor
+
 
 class EncryptionCodec(PayloadCodec):
-    def __init__(self, key_id: str = default_key_id, key: bytes = default_key) -> None:
+    def __init__(
+        self,
+        key_id: str = default_key_id,
+        key: bytes = default_key,
+        parallel_min_bytes: int = PARALLEL_MIN_BYTES,
+        compression: Optional[Compression] = None,
+        keyring: Optional[Keyring] = None,
+        segmented_min_bytes: int = SEGMENTED_MIN_BYTES,
+        segment_bytes: int = CODEC_SEGMENT_BYTES,
+        envelope: bool = CODEC_ENVELOPE,
+        data_keys: Optional[DataKeys] = None,
+    ) -> None:
         super().__init__()
-        self.key_id = key_id
         # We are using direct AESGCM to be compatible with samples from
         # TypeScript and Go. Pure Python samples may prefer the higher-level,
-        # safer APIs.
-        self.encryptor = AESGCM(key)
+        # safer APIs. With CODEC_KEYRING_PATH set, keys come from that file and
+        # are picked up without a restart when it changes.
+        self.keyring = keyring or default_keyring(key_id, key)
+        self.parallel_min_bytes = parallel_min_bytes
+        self.compression = compression or Compression()
+        self.segmented_min_bytes = segmented_min_bytes
+        self.segment_bytes = segment_bytes
+        # Envelope payloads always decode, `envelope` only decides how new payloads are encrypted
+        self.envelope = envelope
+        self.data_keys = data_keys or DataKeys()
 
     async def encode(self, payloads: Iterable[Payload]) -> List[Payload]:
-        # We blindly encode all payloads with the key and set the metadata
-        # saying which key we used
-        return [
-            Payload(
-                metadata={
-                    "encoding": b"binary/encrypted",
-                    "encryption-key-id": self.key_id.encode(),
-                },
-                data=self.encrypt(p.SerializeToString()),
-            )
-            for p in payloads
-        ]
+        # We blindly encode all payloads with the active key and set the metadata
+        # saying which key we used. A batch uses one keyring snapshot even if the
+        # key file is reloaded meanwhile.
+        payloads = list(payloads)
+        keys = self.keyring.snapshot()
+        # With envelope encryption the batch uses the data key of the current time
+        # window, wrapped by the active key. Only segmented payloads derive a key of their own.
+        data_key = self.data_keys.current(keys.active_key_id, keys.active) if self.envelope else None
+        return await self._map(partial(self._encode_one, keys, data_key), payloads, [p.ByteSize() for p in payloads])
 
     async def decode(self, payloads: Iterable[Payload]) -> List[Payload]:
-        ret: List[Payload] = []
-        for p in payloads:
-            # Ignore ones w/out our expected encoding
-            if p.metadata.get("encoding", b"").decode() != "binary/encrypted":
-                ret.append(p)
-                continue
-            # Confirm our key ID is the same
-            key_id = p.metadata.get("encryption-key-id", b"").decode()
-            if key_id != self.key_id:
-                raise ValueError(
-                    f"Unrecognized key ID {key_id}. Current key ID is {self.key_id}."
-                )
-            # Decrypt and append
-            ret.append(Payload.FromString(self.decrypt(p.data)))
+        payloads = list(payloads)
+        keys = self.keyring.snapshot()
+        return await self._map(partial(self._decode_one, keys), payloads, [len(p.data) for p in payloads])
+
+    @property
+    def key_id(self) -> str:
+        return self.keyring.snapshot().active_key_id
+
+    async def _map(
+        self, fn: Callable[[Payload], Payload], payloads: List[Payload], sizes: List[int]
+    ) -> List[Payload]:
+        # Large payloads go to the pool first so they run while the small ones are
+        # handled inline, results keep the input order
+        loop = asyncio.get_running_loop()
+        pooled: Dict[int, asyncio.Future] = {
+            i: loop.run_in_executor(codec_executor(), fn, p)
+            for i, (p, size) in enumerate(zip(payloads, sizes))
+            if size >= self.parallel_min_bytes
+        }
+        try:
+            ret: List[Optional[Payload]] = [None if i in pooled else fn(p) for i, p in enumerate(payloads)]
+            for i, result in zip(pooled, await asyncio.gather(*pooled.values())):
+                ret[i] = result
+        except BaseException:
+            for future in pooled.values():
+                future.cancel()
+            raise
         return ret
 
-    def encrypt(self, data: bytes) -> bytes:
+    def _encode_one(self, keys: KeyringSnapshot, data_key: Optional[Tuple[bytes, bytes, AESGCM]], p: Payload) -> Payload:
+        data, compression = self.compression.compress(p.SerializeToString())
+        metadata = {
+            "encoding": b"binary/encrypted",
+            "encryption-key-id": keys.active_key_id.encode(),
+        }
+        key, cipher = keys.active_key, keys.active
+        if data_key is not None:
+            # The wrapped data key travels with the payload, the key ID names its master key
+            wrapped, key, cipher = data_key
+            metadata["encryption-data-key"] = wrapped
+        if compression is not None:
+            # Compression is applied before encryption, decode reverses it after decrypting
+            metadata["encryption-compression"] = compression.encode()
+        if len(data) >= self.segmented_min_bytes:
+            metadata["encryption-format"] = SEGMENTED
+            return Payload(metadata=metadata, data=seal(key, [data], self.segment_bytes))
+        return Payload(metadata=metadata, data=self.encrypt(data, cipher))
+
+    def _decode_one(self, keys: KeyringSnapshot, p: Payload) -> Payload:
+        # Ignore ones w/out our expected encoding
+        if p.metadata.get("encoding", b"").decode() != "binary/encrypted":
+            return p
+        # Any key still in the keyring decrypts, so histories written before a
+        # rotation stay readable
+        key_id = p.metadata.get("encryption-key-id", b"").decode()
+        cipher = keys.ciphers.get(key_id)
+        if cipher is None:
+            raise ValueError(
+                f"Unrecognized key ID {key_id}. Current key ID is {keys.active_key_id}."
+            )
+        key = keys.keys[key_id]
+        wrapped = p.metadata.get("encryption-data-key")
+        if wrapped:
+            # Unwrapped once per data key, later payloads hit the data key cache
+            key, cipher = self.data_keys.unwrapped(key_id, cipher, wrapped)
+        # Decrypt, then decompress when encode compressed it. Payloads written
+        # before compression or segments existed carry neither in their metadata.
+        data = p.data
+        if p.metadata.get("encryption-format", b"") == SEGMENTED:
+            data = open_sealed(key, data)
+        elif "encryption-format" in p.metadata:
+            raise ValueError(f"Unrecognized encryption format {p.metadata['encryption-format'].decode()}")
+        else:
+            data = self.decrypt(data, cipher)
+        compression = p.metadata.get("encryption-compression", b"").decode()
+        if compression:
+            data = decompress(data, compression)
+        return Payload.FromString(data)
+
+    def encrypt(self, data: bytes, cipher: Optional[AESGCM] = None) -> bytes:
+        cipher = cipher or self.keyring.snapshot().active
         nonce = os.urandom(12)
-        return nonce + self.encryptor.encrypt(nonce, data, None)
+        return nonce + cipher.encrypt(nonce, data, None)
 
-    def decrypt(self, data: bytes) -> bytes:
-        return self.encryptor.decrypt(data[:12], data[12:], None)
\ No newline at end of file
+    def decrypt(self, data: bytes, cipher: Optional[AESGCM] = None) -> bytes:
+        cipher = cipher or self.keyring.snapshot().active
+        # Slice through a view, the ciphertext is not copied before decryption
+        view = memoryview(data)
+        return cipher.decrypt(bytes(view[:12]), view[12:], None)
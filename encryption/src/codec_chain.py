@@ -0,0 +1,38 @@
+from typing import Iterable, List, Optional, Sequence
+
+from restack_ai.security import Payload, PayloadCodec
+
+from .claim_check import CODEC_CLAIM_CHECK, ClaimCheckCodec
+from .codec import EncryptionCodec
+from .keyring import Keyring
+
+
+class CodecChain(PayloadCodec):
+    """Applies codecs in order on encode and in reverse order on decode."""
+
+    def __init__(self, codecs: Sequence[PayloadCodec]) -> None:
+        super().__init__()
+        self.codecs = list(codecs)
+
+    async def encode(self, payloads: Iterable[Payload]) -> List[Payload]:
+        payloads = list(payloads)
+        for codec in self.codecs:
+            payloads = await codec.encode(payloads)
+        return payloads
+
+    async def decode(self, payloads: Iterable[Payload]) -> List[Payload]:
+        payloads = list(payloads)
+        for codec in reversed(self.codecs):
+            payloads = await codec.decode(payloads)
+        return payloads
+
+
+def default_codec(keyring: Optional[Keyring] = None) -> PayloadCodec:
+    """The codec used by the client and the codec server, configured from the environment."""
+    encryption = EncryptionCodec(keyring=keyring)
+    codecs: List[PayloadCodec] = [encryption]
+    if CODEC_CLAIM_CHECK:
+        # Claim check first so blobs are addressed by their plaintext and deduplicate, the
+        # blobs themselves and the references left in history are both encrypted
+        codecs.insert(0, ClaimCheckCodec(blob_codec=encryption, keyring=encryption.keyring))
+    return codecs[0] if len(codecs) == 1 else CodecChain(codecs)
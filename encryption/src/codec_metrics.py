@@ -0,0 +1,114 @@
+import bisect
+from typing import Any, Dict, List, Sequence
+
+# Upper bounds of the histogram buckets, the last bucket is unbounded
+LATENCY_BUCKETS_SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SIZE_BUCKETS_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[int]:
+        running, out = 0, []
+        for count in self.counts:
+            running += count
+            out.append(running)
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "buckets": {str(bound): count for bound, count in zip(self.buckets + ("+Inf",), self.cumulative())},
+            "count": self.count,
+            "sum": self.sum,
+        }
+
+
+class OperationMetrics:
+    def __init__(self) -> None:
+        self.requests = 0
+        self.errors = 0
+        self.payloads = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.latency = Histogram(LATENCY_BUCKETS_SECONDS)
+        self.payload_size = Histogram(SIZE_BUCKETS_BYTES)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "payloads": self.payloads,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "latency_seconds": self.latency.to_dict(),
+            "payload_size_bytes": self.payload_size.to_dict(),
+        }
+
+
+class CodecMetrics:
+    """Request counters and histograms per codec server operation."""
+
+    def __init__(self) -> None:
+        self.operations: Dict[str, OperationMetrics] = {}
+
+    def operation(self, name: str) -> OperationMetrics:
+        if name not in self.operations:
+            self.operations[name] = OperationMetrics()
+        return self.operations[name]
+
+    def to_dict(self, cache: Dict[str, Any]) -> Dict[str, Any]:
+        return {"operations": {name: op.to_dict() for name, op in self.operations.items()}, "decode_cache": cache}
+
+    def to_prometheus(self, cache: Dict[str, Any]) -> str:
+        lines: List[str] = []
+
+        def histogram(name: str, label: str, h: Histogram) -> None:
+            for bound, count in zip(h.buckets + ("+Inf",), h.cumulative()):
+                lines.append(f'{name}_bucket{{operation="{label}",le="{bound}"}} {count}')
+            lines.append(f'{name}_count{{operation="{label}"}} {h.count}')
+            lines.append(f'{name}_sum{{operation="{label}"}} {h.sum}')
+
+        lines += [
+            "# TYPE codec_requests_total counter",
+            *(f'codec_requests_total{{operation="{n}"}} {op.requests}' for n, op in self.operations.items()),
+            "# TYPE codec_errors_total counter",
+            *(f'codec_errors_total{{operation="{n}"}} {op.errors}' for n, op in self.operations.items()),
+            "# TYPE codec_payloads_total counter",
+            *(f'codec_payloads_total{{operation="{n}"}} {op.payloads}' for n, op in self.operations.items()),
+            "# TYPE codec_request_bytes_total counter",
+            *(f'codec_request_bytes_total{{operation="{n}"}} {op.bytes_in}' for n, op in self.operations.items()),
+            "# TYPE codec_response_bytes_total counter",
+            *(f'codec_response_bytes_total{{operation="{n}"}} {op.bytes_out}' for n, op in self.operations.items()),
+            "# TYPE codec_request_duration_seconds histogram",
+        ]
+        for name, op in self.operations.items():
+            histogram("codec_request_duration_seconds", name, op.latency)
+        lines.append("# TYPE codec_payload_size_bytes histogram")
+        for name, op in self.operations.items():
+            histogram("codec_payload_size_bytes", name, op.payload_size)
+
+        lines += [
+            "# TYPE codec_decode_cache_hits_total counter",
+            f"codec_decode_cache_hits_total {cache['hits']}",
+            "# TYPE codec_decode_cache_misses_total counter",
+            f"codec_decode_cache_misses_total {cache['misses']}",
+            "# TYPE codec_decode_cache_evictions_total counter",
+            f"codec_decode_cache_evictions_total {cache['evictions']}",
+            "# TYPE codec_decode_cache_hit_ratio gauge",
+            f"codec_decode_cache_hit_ratio {cache['hit_rate']}",
+            "# TYPE codec_decode_cache_bytes gauge",
+            f"codec_decode_cache_bytes {cache['bytes']}",
+            "# TYPE codec_decode_cache_entries gauge",
+            f"codec_decode_cache_entries {cache['entries']}",
+        ]
+        return "\n".join(lines) + "\n"
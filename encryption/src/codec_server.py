@@ -1,11 +1,85 @@
+import json
+import os
+import time
 from functools import partial
-from typing import Awaitable, Callable, Iterable, List
+from typing import Awaitable, Callable, Iterable, List, Tuple
 
 from aiohttp import hdrs, web
 from google.protobuf import json_format
+from google.protobuf.message import DecodeError
 from restack_ai.security import Payload, Payloads
 
-from .codec import EncryptionCodec
+from .codec import default_keyring
+from .codec_chain import default_codec
+from .codec_metrics import CodecMetrics, OperationMetrics
+from .decode_cache import CachingDecoder, DecodeCache
+
+JSON = "application/json"
+PROTOBUF = "application/x-protobuf"
+# Responses smaller than this are not worth gzipping
+GZIP_MIN_BYTES = 1024
+# Largest request body accepted, larger ones get 413. aiohttp defaults to 1 MiB, below
+# a single large payload, and JSON bodies carry payload data base64 encoded (4/3 larger)
+CODEC_SERVER_MAX_BODY_BYTES = int(os.getenv("CODEC_SERVER_MAX_BODY_BYTES", str(256 * 1024 * 1024)))
+
+
+def _write_varint(value: int) -> bytes:
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = shift = 0
+    while True:
+        if pos >= len(data):
+            raise DecodeError("Truncated varint")
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+
+
+# A batch on the wire is `message PayloadsBatch { repeated Payloads batches = 1; }`,
+# every entry is the field 1 tag, a length and one serialised Payloads
+_BATCH_TAG = b"\x0a"
+
+
+def encode_batch(batches: Iterable[Payloads]) -> bytes:
+    parts = []
+    for payloads in batches:
+        data = payloads.SerializeToString()
+        parts += [_BATCH_TAG, _write_varint(len(data)), data]
+    return b"".join(parts)
+
+
+def decode_batch(data: bytes) -> List[Payloads]:
+    batches = []
+    pos = 0
+    while pos < len(data):
+        if data[pos:pos + 1] != _BATCH_TAG:
+            raise DecodeError(f"Unexpected field tag at offset {pos}")
+        length, pos = _read_varint(data, pos + 1)
+        if pos + length > len(data):
+            raise DecodeError("Truncated batch entry")
+        batches.append(Payloads.FromString(data[pos:pos + length]))
+        pos += length
+    return batches
+
+
+def _response_type(req: web.Request) -> str:
+    # Answer in the format the client accepts, defaulting to the request format
+    accept = req.headers.get(hdrs.ACCEPT, "")
+    if PROTOBUF in accept:
+        return PROTOBUF
+    if JSON in accept:
+        return JSON
+    return req.content_type
 
 
 def build_codec_server() -> web.Application:
@@ -15,37 +89,126 @@ def build_codec_server() -> web.Application:
         if req.headers.get(hdrs.ORIGIN) == "http://localhost:8233":
             resp.headers[hdrs.ACCESS_CONTROL_ALLOW_ORIGIN] = "http://localhost:8233"
             resp.headers[hdrs.ACCESS_CONTROL_ALLOW_METHODS] = "POST"
-            resp.headers[hdrs.ACCESS_CONTROL_ALLOW_HEADERS] = "content-type,x-namespace"
+            resp.headers[hdrs.ACCESS_CONTROL_ALLOW_HEADERS] = "content-type,content-encoding,accept,x-namespace"
         return resp
 
+    async def read_body(req: web.Request) -> bytes:
+        if req.content_type not in (JSON, PROTOBUF):
+            raise web.HTTPUnsupportedMediaType(text=f"Expected {JSON} or {PROTOBUF}")
+        # aiohttp already inflates gzip request bodies (Content-Encoding: gzip)
+        return await req.read()
+
+    async def respond(req: web.Request, body: bytes, content_type: str, op: OperationMetrics) -> web.Response:
+        op.bytes_out += len(body)
+        resp = await cors_options(req)
+        resp.content_type = content_type
+        resp.body = body
+        if len(body) >= GZIP_MIN_BYTES:
+            # Only gzips when the client sent Accept-Encoding: gzip
+            resp.enable_compression()
+        return resp
+
+    def observe(op: OperationMetrics, body: bytes, payloads: Iterable[Payload]) -> None:
+        op.bytes_in += len(body)
+        for p in payloads:
+            op.payloads += 1
+            op.payload_size.observe(p.ByteSize())
+
+    def instrumented(name: str, handler: Callable[..., Awaitable[web.Response]]) -> Callable[[web.Request], Awaitable[web.Response]]:
+        async def run(req: web.Request) -> web.Response:
+            op = metrics.operation(name)
+            op.requests += 1
+            started = time.perf_counter()
+            try:
+                return await handler(op, req)
+            except Exception:
+                op.errors += 1
+                raise
+            finally:
+                op.latency.observe(time.perf_counter() - started)
+        return run
+
     # General purpose payloads-to-payloads
     async def apply(
-        fn: Callable[[Iterable[Payload]], Awaitable[List[Payload]]], req: web.Request
+        fn: Callable[[Iterable[Payload]], Awaitable[List[Payload]]], op: OperationMetrics, req: web.Request
     ) -> web.Response:
-        # Read payloads as JSON
-        assert req.content_type == "application/json"
-        payloads = json_format.Parse(await req.read(), Payloads())
+        body = await read_body(req)
+        try:
+            if req.content_type == PROTOBUF:
+                payloads = Payloads.FromString(body)
+            else:
+                payloads = json_format.Parse(body, Payloads())
+        except (DecodeError, json_format.ParseError) as e:
+            raise web.HTTPBadRequest(text=f"Invalid Payloads: {e}")
+        observe(op, body, payloads.payloads)
 
         # Apply
         payloads = Payloads(payloads=await fn(payloads.payloads))
 
-        # Apply CORS and return JSON
-        resp = await cors_options(req)
-        resp.content_type = "application/json"
-        resp.text = json_format.MessageToJson(payloads)
-        return resp
+        content_type = _response_type(req)
+        if content_type == PROTOBUF:
+            return await respond(req, payloads.SerializeToString(), PROTOBUF, op)
+        return await respond(req, json_format.MessageToJson(payloads).encode(), JSON, op)
+
+    # Many Payloads sets in one round trip, e.g. a whole history page
+    async def decode_batch_route(op: OperationMetrics, req: web.Request) -> web.Response:
+        body = await read_body(req)
+        try:
+            if req.content_type == PROTOBUF:
+                batches = decode_batch(body)
+            else:
+                batches = [
+                    json_format.ParseDict(entry, Payloads())
+                    for entry in json.loads(body)["batches"]
+                ]
+        except (DecodeError, json_format.ParseError, ValueError, KeyError, TypeError) as e:
+            raise web.HTTPBadRequest(text=f"Invalid Payloads batch: {e}")
+        flat = [p for payloads in batches for p in payloads.payloads]
+        observe(op, body, flat)
+
+        # One codec call for everything so large payloads of different sets decode in parallel
+        decoded = await decoder.decode(flat)
+        results: List[Payloads] = []
+        start = 0
+        for payloads in batches:
+            end = start + len(payloads.payloads)
+            results.append(Payloads(payloads=decoded[start:end]))
+            start = end
+
+        content_type = _response_type(req)
+        if content_type == PROTOBUF:
+            return await respond(req, encode_batch(results), PROTOBUF, op)
+        body = "{\"batches\": [" + ",".join(json_format.MessageToJson(r, indent=None) for r in results) + "]}"
+        return await respond(req, body.encode(), JSON, op)
+
+    async def metrics_route(req: web.Request) -> web.Response:
+        # Prometheus text by default, JSON when asked for
+        cache_stats = cache.stats()
+        if JSON in req.headers.get(hdrs.ACCEPT, "") or req.query.get("format") == "json":
+            return web.json_response(metrics.to_dict(cache_stats))
+        return web.Response(text=metrics.to_prometheus(cache_stats), content_type="text/plain")
 
     # Build app
-    codec = EncryptionCodec()
-    app = web.Application()
+    keyring = default_keyring()
+    codec = default_codec(keyring)
+    # The UI decodes the same history payloads again as users page back and forth.
+    # Entries of keys removed from the keyring are dropped on reload.
+    cache = DecodeCache()
+    decoder = CachingDecoder(codec, cache, keyring)
+    metrics = CodecMetrics()
+    app = web.Application(client_max_size=CODEC_SERVER_MAX_BODY_BYTES)
     app.add_routes(
         [
-            web.post("/encode", partial(apply, codec.encode)),
-            web.post("/decode", partial(apply, codec.decode)),
+            web.post("/encode", instrumented("encode", partial(apply, codec.encode))),
+            web.post("/decode", instrumented("decode", partial(apply, decoder.decode))),
+            web.post("/decode/batch", instrumented("decode_batch", decode_batch_route)),
+            web.get("/metrics", metrics_route),
+            web.options("/encode", cors_options),
             web.options("/decode", cors_options),
+            web.options("/decode/batch", cors_options),
         ]
     )
     return app
 
 def run_codec_server():
-    web.run_app(build_codec_server(), host="127.0.0.1", port=8081)
\ No newline at end of file
+    web.run_app(build_codec_server(), host="127.0.0.1", port=8081)
@@ -0,0 +1,77 @@
+import os
+import threading
+import zlib
+from typing import Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:  # Optional, `poetry install --extras zstd`
+    zstandard = None
+
+ALGORITHMS = ("none", "zlib", "zstd")
+
+# Compress payloads before encryption, ciphertext does not compress downstream
+CODEC_COMPRESSION = os.getenv("CODEC_COMPRESSION", "none")
+# Smaller payloads are stored as is, the frame overhead would eat the gain
+CODEC_COMPRESSION_MIN_BYTES = int(os.getenv("CODEC_COMPRESSION_MIN_BYTES", "1024"))
+# Unset uses the library default: 3 for zstd, 6 for zlib
+CODEC_COMPRESSION_LEVEL = os.getenv("CODEC_COMPRESSION_LEVEL")
+
+_local = threading.local()
+
+
+def _zstd_compressor(level: int) -> "zstandard.ZstdCompressor":
+    # zstandard contexts must not be shared between threads, keep one per thread and level
+    compressors = _local.__dict__.setdefault("zstd_compressors", {})
+    if level not in compressors:
+        compressors[level] = zstandard.ZstdCompressor(level=level)
+    return compressors[level]
+
+
+def _zstd_decompressor() -> "zstandard.ZstdDecompressor":
+    if not hasattr(_local, "zstd_decompressor"):
+        _local.zstd_decompressor = zstandard.ZstdDecompressor()
+    return _local.zstd_decompressor
+
+
+class Compression:
+    """Optional compression of serialised payloads, applied before encryption."""
+
+    def __init__(
+        self,
+        algorithm: str = CODEC_COMPRESSION,
+        level: Optional[int] = None,
+        min_bytes: int = CODEC_COMPRESSION_MIN_BYTES,
+    ) -> None:
+        if algorithm not in ALGORITHMS:
+            raise ValueError(f"Unknown compression {algorithm!r}, expected one of {', '.join(ALGORITHMS)}")
+        if algorithm == "zstd" and zstandard is None:
+            raise RuntimeError("zstd compression needs zstandard, install it with `poetry install --extras zstd`")
+        if level is None and CODEC_COMPRESSION_LEVEL:
+            level = int(CODEC_COMPRESSION_LEVEL)
+        self.algorithm = algorithm
+        self.level = level
+        self.min_bytes = min_bytes
+
+    def compress(self, data: bytes) -> Tuple[bytes, Optional[str]]:
+        """Compressed data and the algorithm used, or the input and None when it did not pay off."""
+        if self.algorithm == "none" or len(data) < self.min_bytes:
+            return data, None
+        if self.algorithm == "zstd":
+            compressed = _zstd_compressor(3 if self.level is None else self.level).compress(data)
+        else:
+            compressed = zlib.compress(data, -1 if self.level is None else self.level)
+        # Already compressed content (images, archives) is stored as is
+        if len(compressed) >= len(data):
+            return data, None
+        return compressed, self.algorithm
+
+
+def decompress(data: bytes, algorithm: str) -> bytes:
+    if algorithm == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Payload is zstd compressed, install zstandard with `poetry install --extras zstd`")
+        return _zstd_decompressor().decompress(data)
+    if algorithm == "zlib":
+        return zlib.decompress(data)
+    raise ValueError(f"Unrecognized compression {algorithm}")
@@ -0,0 +1,114 @@
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from typing import Any, Collection, Dict, Iterable, List, Optional, Tuple
+
+from restack_ai.security import Payload, PayloadCodec
+
+from .codec import PARALLEL_MIN_BYTES, codec_executor
+from .keyring import Keyring, KeyringSnapshot
+
+# Memory budget for decoded payloads kept by the codec server, 0 disables the cache
+CODEC_DECODE_CACHE_BYTES = int(os.getenv("CODEC_DECODE_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Payloads larger than this share of the budget are never cached, one of them would flush everything else
+MAX_ENTRY_SHARE = 0.125
+# Rough per-entry cost of the key, the dict slot and the message object
+ENTRY_OVERHEAD_BYTES = 256
+
+
+def _cache_keys(payloads: List[Payload]) -> List[bytes]:
+    # The whole encoded payload, metadata and so its key ID included, decides what it decodes to
+    return [hashlib.blake2b(p.SerializeToString(), digest_size=16).digest() for p in payloads]
+
+
+class DecodeCache:
+    """LRU of decoded payloads keyed by a hash of the encoded payload, bounded in bytes."""
+
+    def __init__(self, max_bytes: int = CODEC_DECODE_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        # hash -> (decoded payload, size, ID of the key that decrypted it)
+        self._entries: "OrderedDict[bytes, Tuple[Payload, int, str]]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: bytes) -> Optional[Payload]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: bytes, payload: Payload, key_id: str = "") -> None:
+        size = payload.ByteSize() + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes * MAX_ENTRY_SHARE or key in self._entries:
+            return
+        self._entries[key] = (payload, size, key_id)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted, _) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def retain_keys(self, key_ids: Collection[str]) -> None:
+        """Drop entries decrypted with a key that is no longer in `key_ids`."""
+        for key, (_, size, key_id) in list(self._entries.items()):
+            if key_id and key_id not in key_ids:
+                del self._entries[key]
+                self.bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class CachingDecoder:
+    """Decodes through `codec`, answering repeated payloads from a DecodeCache.
+
+    With `keyring`, payloads of a key removed from the keyring stop being answered
+    from the cache, they fail to decode like they would without it.
+    """
+
+    def __init__(self, codec: PayloadCodec, cache: DecodeCache, keyring: Optional[Keyring] = None) -> None:
+        self.codec = codec
+        self.cache = cache
+        self.keyring = keyring
+        self._snapshot: Optional[KeyringSnapshot] = None
+
+    async def decode(self, payloads: Iterable[Payload]) -> List[Payload]:
+        payloads = list(payloads)
+        if self.cache.max_bytes <= 0:
+            return await self.codec.decode(payloads)
+        if self.keyring is not None:
+            snapshot = self.keyring.snapshot()
+            # A reload builds a new snapshot, only then can keys have been removed
+            if snapshot is not self._snapshot:
+                self.cache.retain_keys(snapshot.ciphers)
+                self._snapshot = snapshot
+
+        # Hashing large payloads releases the GIL, keep it off the event loop
+        if sum(p.ByteSize() for p in payloads) >= PARALLEL_MIN_BYTES:
+            keys = await asyncio.get_running_loop().run_in_executor(codec_executor(), _cache_keys, payloads)
+        else:
+            keys = _cache_keys(payloads)
+
+        ret: List[Optional[Payload]] = [self.cache.get(key) for key in keys]
+        misses = [i for i, decoded in enumerate(ret) if decoded is None]
+        if misses:
+            decoded = await self.codec.decode([payloads[i] for i in misses])
+            for i, payload in zip(misses, decoded):
+                ret[i] = payload
+                self.cache.put(keys[i], payload, payloads[i].metadata.get("encryption-key-id", b"").decode())
+        return ret
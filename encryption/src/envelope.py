@@ -0,0 +1,85 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# Encrypt payloads with data keys wrapped by the keyring key instead of the keyring key itself
+CODEC_ENVELOPE = os.getenv("CODEC_ENVELOPE", "false").lower() == "true"
+# A new data key is generated for every window of this many seconds
+CODEC_DATA_KEY_SECONDS = float(os.getenv("CODEC_DATA_KEY_SECONDS", "3600"))
+# Unwrapped data keys are kept this long after their last use when decoding
+CODEC_DATA_KEY_CACHE_SECONDS = float(os.getenv("CODEC_DATA_KEY_CACHE_SECONDS", "900"))
+CODEC_DATA_KEY_CACHE_SIZE = int(os.getenv("CODEC_DATA_KEY_CACHE_SIZE", "1024"))
+
+
+def wrap(master_key_id: str, master: AESGCM, data_key: bytes) -> bytes:
+    # The master key ID is bound as associated data, a wrapped key only opens under its own master
+    nonce = os.urandom(12)
+    return nonce + master.encrypt(nonce, data_key, b"data-key:" + master_key_id.encode())
+
+
+def unwrap(master_key_id: str, master: AESGCM, wrapped: bytes) -> bytes:
+    return master.decrypt(wrapped[:12], wrapped[12:], b"data-key:" + master_key_id.encode())
+
+
+class DataKeys:
+    """Data keys for envelope encryption, with their ciphers built once.
+
+    Encoding uses one data key per time window and master key, so the master
+    key only wraps a new data key when the window rolls over. Decoding unwraps
+    each distinct wrapped key once and keeps its cipher for a TTL.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float = CODEC_DATA_KEY_SECONDS,
+        cache_seconds: float = CODEC_DATA_KEY_CACHE_SECONDS,
+        cache_size: int = CODEC_DATA_KEY_CACHE_SIZE,
+    ) -> None:
+        self.window_seconds = window_seconds
+        self.cache_seconds = cache_seconds
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        # (master key ID, window) -> (wrapped key, (data key, cipher))
+        self._current: Optional[Tuple[Tuple[str, int], bytes, Tuple[bytes, AESGCM]]] = None
+        # wrapped key -> ((data key, cipher), expiry)
+        self._unwrapped: "OrderedDict[bytes, Tuple[Tuple[bytes, AESGCM], float]]" = OrderedDict()
+
+    def current(self, master_key_id: str, master: AESGCM) -> Tuple[bytes, bytes, AESGCM]:
+        """Wrapped data key, data key and cipher to encrypt with now."""
+        slot = (master_key_id, int(time.time() // self.window_seconds))
+        current = self._current
+        if current is not None and current[0] == slot:
+            return (current[1], *current[2])
+        with self._lock:
+            if self._current is None or self._current[0] != slot:
+                data_key = AESGCM.generate_key(bit_length=256)
+                wrapped = wrap(master_key_id, master, data_key)
+                self._current = (slot, wrapped, (data_key, AESGCM(data_key)))
+                # Payloads written with it decode without unwrapping
+                self._remember(wrapped, self._current[2])
+            return (self._current[1], *self._current[2])
+
+    def unwrapped(self, master_key_id: str, master: AESGCM, wrapped: bytes) -> Tuple[bytes, AESGCM]:
+        """Data key and cipher of a wrapped data key read from payload metadata."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._unwrapped.get(wrapped)
+            if entry is not None and entry[1] > now:
+                self._unwrapped[wrapped] = (entry[0], now + self.cache_seconds)
+                self._unwrapped.move_to_end(wrapped)
+                return entry[0]
+        data_key = unwrap(master_key_id, master, wrapped)
+        key = (data_key, AESGCM(data_key))
+        with self._lock:
+            self._remember(wrapped, key)
+        return key
+
+    def _remember(self, wrapped: bytes, key: Tuple[bytes, AESGCM]) -> None:
+        self._unwrapped[wrapped] = (key, time.monotonic() + self.cache_seconds)
+        self._unwrapped.move_to_end(wrapped)
+        while len(self._unwrapped) > self.cache_size:
+            self._unwrapped.popitem(last=False)
@@ -0,0 +1,113 @@
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Mapping, Optional
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+logger = logging.getLogger(__name__)
+
+# JSON key file: {"active": "<key id>", "keys": {"<key id>": "<base64 AES key>", ...}}
+CODEC_KEYRING_PATH = os.getenv("CODEC_KEYRING_PATH")
+# How often the key file is checked for changes, 0 checks on every encode and decode call
+CODEC_KEYRING_RELOAD_SECONDS = float(os.getenv("CODEC_KEYRING_RELOAD_SECONDS", "5"))
+
+
+@dataclass(frozen=True)
+class KeyringSnapshot:
+    active_key_id: str
+    # One prebuilt cipher per key, decode picks it by the payload key ID
+    ciphers: Mapping[str, AESGCM]
+    # Raw key material, segmented payloads derive a key per payload from it
+    keys: Mapping[str, bytes]
+
+    @property
+    def active(self) -> AESGCM:
+        return self.ciphers[self.active_key_id]
+
+    @property
+    def active_key(self) -> bytes:
+        return self.keys[self.active_key_id]
+
+
+def _snapshot(keys: Mapping[str, bytes], active_key_id: str) -> KeyringSnapshot:
+    if active_key_id not in keys:
+        raise ValueError(f"Active key ID {active_key_id} is not in the keyring")
+    return KeyringSnapshot(active_key_id, {key_id: AESGCM(key) for key_id, key in keys.items()}, dict(keys))
+
+
+def _read_key_file(path: str) -> KeyringSnapshot:
+    with open(path) as f:
+        config = json.load(f)
+    # Malformed files raise ValueError like broken JSON does, so a reload keeps the current keys
+    if not isinstance(config, dict) or not isinstance(config.get("keys"), dict):
+        raise ValueError(f"Key file {path} needs a \"keys\" object")
+    if not isinstance(config.get("active"), str):
+        raise ValueError(f"Key file {path} needs an \"active\" key ID")
+    if not all(isinstance(key, str) for key in config["keys"].values()):
+        raise ValueError(f"Key file {path} has keys that are not base64 strings")
+    keys = {key_id: base64.b64decode(key) for key_id, key in config["keys"].items()}
+    return _snapshot(keys, config["active"])
+
+
+class Keyring:
+    """Keys by ID with one active encryption key, optionally reloaded from a key file.
+
+    Readers take `snapshot()` once per batch and never see a half-applied reload.
+    """
+
+    def __init__(
+        self,
+        keys: Optional[Mapping[str, bytes]] = None,
+        active_key_id: Optional[str] = None,
+        path: Optional[str] = None,
+        reload_seconds: float = CODEC_KEYRING_RELOAD_SECONDS,
+    ) -> None:
+        if path is None and (keys is None or active_key_id is None):
+            raise ValueError("A keyring needs either keys and an active key ID, or a key file")
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._checked = 0.0
+        if path is not None:
+            self._mtime = os.stat(path).st_mtime
+            self._current = _read_key_file(path)
+            self._checked = time.monotonic()
+        else:
+            self._current = _snapshot(keys, active_key_id)
+
+    @classmethod
+    def from_file(cls, path: str, reload_seconds: float = CODEC_KEYRING_RELOAD_SECONDS) -> "Keyring":
+        return cls(path=path, reload_seconds=reload_seconds)
+
+    def snapshot(self) -> KeyringSnapshot:
+        if self.path is not None and time.monotonic() - self._checked >= self.reload_seconds:
+            self.reload()
+        return self._current
+
+    def reload(self, force: bool = False) -> bool:
+        """Re-read the key file if it changed. A broken file keeps the current keys."""
+        if self.path is None:
+            return False
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if not force and mtime == self._mtime:
+                    return False
+                current = _read_key_file(self.path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Keeping current keys, failed to reload %s: %s", self.path, e)
+                return False
+            self._current, self._mtime = current, mtime
+        logger.info("Reloaded keyring from %s, active key ID %s", self.path, current.active_key_id)
+        return True
+
+    def key_ids(self) -> Dict[str, bool]:
+        current = self._current
+        return {key_id: key_id == current.active_key_id for key_id in current.ciphers}
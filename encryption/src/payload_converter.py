@@ -0,0 +1,114 @@
+import decimal
+import json
+import os
+from functools import lru_cache
+from typing import Any, Optional, Type
+
+from pydantic import BaseModel, TypeAdapter
+from pydantic.errors import PydanticSchemaGenerationError
+from restack_ai.security import Payload, converter
+
+try:
+    import orjson
+except ImportError:  # Optional, `poetry install --extras orjson`
+    orjson = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CONVERTERS = ("default", "orjson")
+
+# JSON library used to turn workflow and function values into payloads
+PAYLOAD_CONVERTER = os.getenv("PAYLOAD_CONVERTER", "default")
+
+_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson else 0
+
+
+def _default(value: Any) -> Any:
+    # Called by orjson only for types it does not encode itself
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        # Dtypes orjson does not encode natively, e.g. object arrays
+        return value.tolist()
+    if numpy is not None and isinstance(value, numpy.generic):
+        return value.item()
+    raise TypeError(f"Type {type(value).__name__} is not JSON serializable")
+
+
+@lru_cache(maxsize=None)
+def _adapter(type_hint: Any) -> Optional[TypeAdapter]:
+    # Building the validator is the expensive part of pydantic decoding, do it once per type
+    try:
+        return TypeAdapter(type_hint)
+    except PydanticSchemaGenerationError:
+        return None
+
+
+class OrjsonPlainPayloadConverter(converter.EncodingPayloadConverter):
+    """`json/plain` payloads written with orjson and read with cached pydantic validators.
+
+    Payloads stay compatible with the default converter in both directions.
+    """
+
+    @property
+    def encoding(self) -> str:
+        return "json/plain"
+
+    def to_payload(self, value: Any) -> Optional[Payload]:
+        if isinstance(value, BaseModel):
+            # pydantic serialises its own models faster than a dict round trip through orjson
+            data = value.__pydantic_serializer__.to_json(value)
+        else:
+            try:
+                data = orjson.dumps(value, default=_default, option=_OPTIONS)
+            except orjson.JSONEncodeError:
+                # orjson rejects what it cannot encode exactly, e.g. ints beyond 64 bits,
+                # the standard library writes those like the default converter does
+                data = json.dumps(value, default=_default, separators=(",", ":")).encode()
+        return Payload(metadata={"encoding": self.encoding.encode()}, data=data)
+
+    def from_payload(self, payload: Payload, type_hint: Optional[Type] = None) -> Any:
+        try:
+            if type_hint is None or type_hint is Any or type_hint in (dict, list, str, int, float, bool):
+                return orjson.loads(payload.data)
+            try:
+                adapter = _adapter(type_hint)
+            except TypeError:
+                # Unhashable type hint, cannot be cached
+                adapter = None
+            if adapter is None:
+                return converter.value_to_type(type_hint, orjson.loads(payload.data), [])
+            # Parses and validates in one pass without building the intermediate dict
+            return adapter.validate_json(payload.data)
+        except Exception as e:
+            raise RuntimeError("Failed parsing") from e
+
+
+class OrjsonPayloadConverter(converter.CompositePayloadConverter):
+    """The default payload converters with orjson in place of the standard library JSON one."""
+
+    def __init__(self) -> None:
+        super().__init__(
+            *(
+                OrjsonPlainPayloadConverter() if isinstance(c, converter.JSONPlainPayloadConverter) else c
+                for c in converter.DefaultPayloadConverter.default_encoding_payload_converters
+            )
+        )
+
+
+def payload_converter_class(name: str = PAYLOAD_CONVERTER) -> Type[converter.PayloadConverter]:
+    """The payload converter class for `DataConverter`, configured from the environment."""
+    if name not in CONVERTERS:
+        raise ValueError(f"Unknown payload converter {name!r}, expected one of {', '.join(CONVERTERS)}")
+    if name == "default":
+        return converter.DefaultPayloadConverter
+    if orjson is None:
+        raise RuntimeError("The orjson payload converter needs orjson, install it with `poetry install --extras orjson`")
+    return OrjsonPayloadConverter
@@ -0,0 +1,181 @@
+"""Segmented AES-GCM: large payloads sealed in fixed-size segments.
+
+Layout: a 28-byte header (version, segment size, random salt, random nonce prefix)
+followed by the segments, each `segment size + 16` bytes except the last one.
+Every payload is sealed with its own key, derived with HKDF-SHA256 from the
+caller's key and the header salt, as in Tink's streaming AEAD. The long-lived key
+never encrypts data itself, so the short nonce prefix only has to be unique per
+derived key. Segment i is sealed with nonce `prefix || i || final flag` and the
+header as associated data, so segments cannot be reordered, dropped, or cut off at
+a segment boundary without decryption failing. Memory use is bounded by the
+segment size when streaming between files.
+
+Version 1 payloads (no salt, segments sealed with the caller's key directly)
+still decrypt.
+"""
+import io
+import os
+import struct
+from typing import BinaryIO, Iterable, Iterator, Tuple, Union
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+VERSION = 2
+# version (1) | segment size (4) | salt (16) | nonce prefix (7)
+_HEADER = struct.Struct(">BI16s7s")
+HEADER_BYTES = _HEADER.size
+# version (1) | segment size (4) | nonce prefix (7)
+_HEADER_V1 = struct.Struct(">BI7s")
+TAG_BYTES = 16
+MAX_SEGMENTS = 2**32
+# The header is read before anything is authenticated, larger segment sizes are rejected
+# instead of trusted for allocations
+MAX_SEGMENT_BYTES = 64 * 1024 * 1024
+
+# Plaintext bytes per segment
+CODEC_SEGMENT_BYTES = int(os.getenv("CODEC_SEGMENT_BYTES", str(1024 * 1024)))
+
+
+def _nonce(prefix: bytes, index: int, final: bool) -> bytes:
+    if index >= MAX_SEGMENTS:
+        raise ValueError("Too many segments for one payload")
+    return prefix + index.to_bytes(4, "big") + (b"\x01" if final else b"\x00")
+
+
+def _check_segment_bytes(segment_bytes: int) -> None:
+    if not 1 <= segment_bytes <= MAX_SEGMENT_BYTES:
+        raise ValueError(f"Segment size {segment_bytes} is not between 1 and {MAX_SEGMENT_BYTES} bytes")
+
+
+def _segment_cipher(key: bytes, header: bytes, salt: bytes) -> AESGCM:
+    # The version and segment size are bound into the derived key as HKDF info
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=len(key), salt=salt, info=b"segmented-aes-gcm" + header[:5])
+    return AESGCM(hkdf.derive(key))
+
+
+def _parse_header(key: bytes, data: BytesLike) -> Tuple[int, bytes, bytes, AESGCM]:
+    """Segment size, nonce prefix, header bytes and segment cipher of a sealed payload."""
+    if len(data) < 1:
+        raise ValueError("Truncated segmented payload header")
+    version = data[0]
+    if version == 1:
+        header_struct = _HEADER_V1
+    elif version == VERSION:
+        header_struct = _HEADER
+    else:
+        raise ValueError(f"Unsupported segmented payload version {version}")
+    if len(data) < header_struct.size:
+        raise ValueError("Truncated segmented payload header")
+    header = bytes(data[:header_struct.size])
+    segment_bytes, prefix = struct.unpack_from(">I", header, 1)[0], header[-7:]
+    _check_segment_bytes(segment_bytes)
+    # Version 1 sealed segments with the caller's key directly
+    cipher = AESGCM(key) if version == 1 else _segment_cipher(key, header, header[5:21])
+    return segment_bytes, prefix, header, cipher
+
+
+def _rechunk(pieces: Iterable[BytesLike], size: int) -> Iterator[BytesLike]:
+    # Exactly `size` bytes per chunk except the last, slicing large pieces without copying
+    pending = bytearray()
+    produced = False
+    for piece in pieces:
+        view = memoryview(piece).cast("B")
+        if pending:
+            take = min(size - len(pending), len(view))
+            pending += view[:take]
+            view = view[take:]
+            if len(pending) < size:
+                continue
+            yield bytes(pending)
+            produced = True
+            pending = bytearray()
+        while len(view) >= size:
+            yield view[:size]
+            produced = True
+            view = view[size:]
+        pending += view
+    if pending or not produced:
+        yield bytes(pending)
+
+
+def encrypt_segments(
+    key: bytes, pieces: Iterable[BytesLike], segment_bytes: int = CODEC_SEGMENT_BYTES
+) -> Iterator[bytes]:
+    """Header, then one sealed segment per `segment_bytes` of plaintext."""
+    _check_segment_bytes(segment_bytes)
+    salt = os.urandom(16)
+    header = _HEADER.pack(VERSION, segment_bytes, salt, os.urandom(7))
+    prefix = header[-7:]
+    cipher = _segment_cipher(key, header, salt)
+    yield header
+    chunks = _rechunk(pieces, segment_bytes)
+    current = next(chunks)
+    index = 0
+    for following in chunks:
+        yield cipher.encrypt(_nonce(prefix, index, False), current, header)
+        current, index = following, index + 1
+    yield cipher.encrypt(_nonce(prefix, index, True), current, header)
+
+
+def seal(key: bytes, pieces: Iterable[BytesLike], segment_bytes: int = CODEC_SEGMENT_BYTES) -> bytes:
+    out = io.BytesIO()
+    for part in encrypt_segments(key, pieces, segment_bytes):
+        out.write(part)
+    # BytesIO hands its buffer over without another copy
+    return out.getvalue()
+
+
+def open_sealed(key: bytes, data: BytesLike) -> bytes:
+    view = memoryview(data).cast("B")
+    segment_bytes, prefix, header, cipher = _parse_header(key, view)
+    body = view[len(header):]
+    sealed_bytes = segment_bytes + TAG_BYTES
+    count = max(1, -(-len(body) // sealed_bytes))
+    out = io.BytesIO()
+    for index in range(count):
+        segment = body[index * sealed_bytes:(index + 1) * sealed_bytes]
+        out.write(cipher.decrypt(_nonce(prefix, index, index == count - 1), segment, header))
+    return out.getvalue()
+
+
+def _read_exact(reader: BinaryIO, size: int) -> bytes:
+    parts = []
+    while size > 0:
+        part = reader.read(size)
+        if not part:
+            break
+        parts.append(part)
+        size -= len(part)
+    return b"".join(parts)
+
+
+def encrypt_stream(
+    key: bytes, reader: BinaryIO, writer: BinaryIO, segment_bytes: int = CODEC_SEGMENT_BYTES
+) -> int:
+    """Encrypt `reader` into `writer` holding one segment at a time. Returns bytes written."""
+    pieces = iter(lambda: _read_exact(reader, segment_bytes), b"")
+    written = 0
+    for part in encrypt_segments(key, pieces, segment_bytes):
+        written += writer.write(part)
+    return written
+
+
+def decrypt_stream(key: bytes, reader: BinaryIO, writer: BinaryIO) -> int:
+    """Decrypt `reader` into `writer` holding one segment at a time. Returns bytes written."""
+    version = reader.read(1)
+    rest = _HEADER_V1.size if version == b"\x01" else HEADER_BYTES
+    segment_bytes, prefix, header, cipher = _parse_header(key, version + _read_exact(reader, rest - 1))
+    sealed_bytes = segment_bytes + TAG_BYTES
+    current = _read_exact(reader, sealed_bytes)
+    index = written = 0
+    while True:
+        # Only a segment with nothing after it may carry the final flag
+        following = _read_exact(reader, sealed_bytes)
+        written += writer.write(cipher.decrypt(_nonce(prefix, index, not following), current, header))
+        if not following:
+            return written
+        current, index = following, index + 1
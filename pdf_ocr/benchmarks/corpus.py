@@ -0,0 +1,68 @@
+"""Synthetic documents with known text for the OCR benchmarks."""
+import io
+import random
+from dataclasses import dataclass
+from typing import List
+
+from PIL import Image, ImageDraw, ImageFont
+
+WORDS = (
+    "invoice contract payment total amount due date customer supplier order "
+    "number quantity price tax delivery address account reference balance "
+    "agreement party term notice signature company service product period"
+).split()
+
+A4_INCHES = (8.27, 11.69)
+
+
+@dataclass
+class SyntheticDocument:
+    name: str
+    file_type: str
+    content: bytes
+    # Ground truth, one entry per page
+    pages: List[str]
+    dpi: int
+
+
+def _font(size: int) -> ImageFont.ImageFont:
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", size)
+    except OSError:
+        return ImageFont.load_default(size=size)
+
+
+def render_page(text: str, dpi: int) -> Image.Image:
+    width, height = int(A4_INCHES[0] * dpi), int(A4_INCHES[1] * dpi)
+    page = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(page)
+    # 12pt text with 1.5 line spacing
+    font_px = max(8, round(dpi / 6))
+    font = _font(font_px)
+    y = margin = dpi // 2
+    for line in text.split("\n"):
+        draw.text((margin, y), line, fill="black", font=font)
+        y += round(font_px * 1.5)
+    return page
+
+
+def page_text(rng: random.Random, lines: int = 30, words_per_line: int = 8) -> str:
+    return "\n".join(
+        " ".join(rng.choice(WORDS) for _ in range(words_per_line)) for _ in range(lines)
+    )
+
+
+def make_pdf(page_count: int, dpi: int = 150, seed: int = 0) -> SyntheticDocument:
+    rng = random.Random(seed)
+    texts = [page_text(rng) for _ in range(page_count)]
+    pages = [render_page(text, dpi) for text in texts]
+    buffer = io.BytesIO()
+    pages[0].save(buffer, "PDF", save_all=True, append_images=pages[1:], resolution=dpi)
+    return SyntheticDocument(f"pdf-{page_count}p-{dpi}dpi", "application/pdf", buffer.getvalue(), texts, dpi)
+
+
+def make_image(dpi: int = 150, seed: int = 0) -> SyntheticDocument:
+    text = page_text(random.Random(seed))
+    buffer = io.BytesIO()
+    render_page(text, dpi).save(buffer, "PNG")
+    return SyntheticDocument(f"image-{dpi}dpi", "image/png", buffer.getvalue(), [text], dpi)
@@ -0,0 +1,168 @@
+"""Throughput and queue depth of the FilesWorkflow fan-out strategies.
+
+Simulates the engine side without a Restack server: every child waits for a slot
+in an OCR worker pool, then for a summary call. Run from the pdf_ocr folder:
+
+    poetry run python -m benchmarks.fan_out --files 10 100 1000
+
+OCR costs are parameters of the simulation, not measurements. With --calibrate the
+single image, batch overhead and batched image costs are measured on synthetic
+images with the real predictors first (downloads the models on first use).
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from src.workflows.fan_out import run_windowed
+
+
+class SimulatedEngine:
+    def __init__(
+        self, ocr_workers: int, ocr_ms: float, image_ms: float, batch_overhead_ms: float, batched_image_ms: float,
+        llm_ms: float, llm_slots: int,
+    ) -> None:
+        self.ocr = asyncio.Semaphore(ocr_workers)
+        self.ocr_ms = ocr_ms
+        self.image_ms = image_ms
+        self.batch_overhead_ms = batch_overhead_ms
+        self.batched_image_ms = batched_image_ms
+        self.llm_ms = llm_ms
+        self.llm = asyncio.Semaphore(llm_slots)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.ocr_waiting = 0
+        self.peak_ocr_queue = 0
+
+    async def _ocr(self, ms: float) -> None:
+        self.ocr_waiting += 1
+        self.peak_ocr_queue = max(self.peak_ocr_queue, self.ocr_waiting)
+        async with self.ocr:
+            self.ocr_waiting -= 1
+            await asyncio.sleep(ms / 1000)
+
+    async def child(self, is_image: bool) -> None:
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        await self._ocr(self.image_ms if is_image else self.ocr_ms)
+        await asyncio.sleep(self.llm_ms / 1000)
+        self.in_flight -= 1
+
+    async def _summary(self) -> None:
+        async with self.llm:
+            await asyncio.sleep(self.llm_ms / 1000)
+
+    async def batch(self, size: int) -> None:
+        # One predictor call for the batch, then one summary per image and no child
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        await self._ocr(self.batch_overhead_ms + size * self.batched_image_ms)
+        await asyncio.gather(*(self._summary() for _ in range(size)))
+        self.in_flight -= 1
+
+
+async def run_mode(mode: str, images: List[bool], engine: SimulatedEngine, window: int, batch_size: int) -> Dict:
+    started = time.perf_counter()
+
+    if mode == "gather":
+        await asyncio.gather(*(engine.child(is_image) for is_image in images))
+    else:
+        jobs: List[Tuple[int, Callable[[], Awaitable[None]]]] = []
+        batched = set()
+        if mode == "windowed+batching":
+            small = [i for i, is_image in enumerate(images) if is_image]
+            batches = [small[s:s + batch_size] for s in range(0, len(small), batch_size)]
+            batches = [batch for batch in batches if len(batch) > 1]
+            jobs += [(batch[0], lambda b=batch: engine.batch(len(b))) for batch in batches]
+            batched = {i for batch in batches for i in batch}
+        jobs += [(i, lambda i=i: engine.child(images[i])) for i in range(len(images)) if i not in batched]
+        # Same order as FilesWorkflow: batches and children share one window, in upload order
+        jobs.sort(key=lambda job: job[0])
+        await run_windowed([job for _, job in jobs], window)
+
+    seconds = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "files": len(images),
+        "seconds": round(seconds, 3),
+        "files_per_second": round(len(images) / seconds, 1),
+        "peak_in_flight": engine.peak_in_flight,
+        "peak_ocr_queue": engine.peak_ocr_queue,
+    }
+
+
+def calibrate(batch_size: int, repeat: int = 3) -> Dict[str, float]:
+    """Single image, batch overhead and per image batched costs of the real predictors, in ms."""
+    from src.functions.torch_ocr import DocumentExtractionService, _open_image
+
+    from .corpus import make_image
+
+    service = DocumentExtractionService()
+    images = [service._preprocess_image(_open_image(make_image(seed=seed).content)) for seed in range(batch_size)]
+    service._recognise(images[:1], [0.3])
+
+    def best(batch: List) -> float:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            service._recognise(batch, [0.3] * len(batch))
+            timings.append((time.perf_counter() - started) * 1000)
+        return min(timings)
+
+    single = best(images[:1])
+    batched = best(images)
+    per_image = (batched - single) / (batch_size - 1)
+    return {"image_ms": single, "batch_overhead_ms": max(0.0, single - per_image), "batched_image_ms": per_image}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--image-share", type=float, default=0.5)
+    parser.add_argument("--window", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--ocr-workers", type=int, default=4)
+    parser.add_argument("--ocr-ms", type=float, default=40)
+    parser.add_argument("--image-ms", type=float, default=10)
+    parser.add_argument("--batch-overhead-ms", type=float, default=6)
+    parser.add_argument(
+        "--batched-image-ms", type=float, default=1, help="Cost of every image of a batch on top of the batch overhead"
+    )
+    parser.add_argument("--calibrate", action="store_true", help="Measure the image costs with the real predictors")
+    parser.add_argument("--llm-ms", type=float, default=20)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    costs = {"image_ms": args.image_ms, "batch_overhead_ms": args.batch_overhead_ms, "batched_image_ms": args.batched_image_ms}
+    if args.calibrate:
+        costs = calibrate(args.batch_size)
+
+    results = []
+    for count in args.files:
+        rng = random.Random(count)
+        images = [rng.random() < args.image_share for _ in range(count)]
+        for mode in ("gather", "windowed", "windowed+batching"):
+            engine = SimulatedEngine(
+                args.ocr_workers, args.ocr_ms, costs["image_ms"], costs["batch_overhead_ms"], costs["batched_image_ms"],
+                args.llm_ms, args.window,
+            )
+            results.append(asyncio.run(run_mode(mode, images, engine, args.window, args.batch_size)))
+            print(json.dumps(results[-1]), file=sys.stderr, flush=True)
+
+    report = {
+        "config": vars(args),
+        # "assumed" numbers only reflect the cost parameters above
+        "image_costs": {"source": "measured" if args.calibrate else "assumed", **{k: round(v, 2) for k, v in costs.items()}},
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
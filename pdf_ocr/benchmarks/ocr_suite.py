@@ -0,0 +1,177 @@
+"""Offline OCR benchmark: throughput, latency, memory and accuracy on synthetic documents.
+
+Run from the pdf_ocr folder, no Restack engine or network access to the engine needed:
+
+    poetry run python -m benchmarks.ocr_suite --pages 1 5 20 --dpi 100 150 200 --output ocr.json
+
+By default every case runs on float32 `torch` and on `torch-int8`, and the report
+compares their speed and accuracy. To add the ONNX Runtime backends:
+
+    poetry run python -m benchmarks.ocr_suite --backends torch torch-int8 onnx onnx-int8
+
+Each case runs in a fresh process so model load time and peak RSS are per case.
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import sys
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+from src.functions.ocr.backends import BACKENDS
+
+from .corpus import SyntheticDocument, make_image, make_pdf
+from .streaming_memory import peak_rss_mb
+
+
+def _normalise(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein distance, one vectorised row per character of `a`."""
+    if not a or not b:
+        return max(len(a), len(b))
+    target = np.frombuffer(b.encode("utf-32-le"), dtype=np.uint32)
+    ramp = np.arange(len(b) + 1)
+    row = ramp.copy()
+    for i, char in enumerate(a, start=1):
+        substitute = row[:-1] + (target != ord(char))
+        delete = row[1:] + 1
+        candidate = np.empty_like(row)
+        candidate[0] = i
+        candidate[1:] = np.minimum(substitute, delete)
+        # Insertions chain along the row: d[j] = min over k <= j of candidate[k] + (j - k)
+        row = np.minimum.accumulate(candidate - ramp) + ramp
+    return int(row[-1])
+
+
+def char_accuracy(truth: List[str], predicted: List[str]) -> float:
+    expected = _normalise("\n".join(truth))
+    actual = _normalise("\n".join(predicted))
+    if not expected:
+        return 1.0
+    return max(0.0, 1 - edit_distance(expected, actual) / len(expected))
+
+
+def run_case(document: SyntheticDocument, args: Dict[str, Any], queue: multiprocessing.Queue) -> None:
+    from src.functions.ocr.registry import registry
+    from src.functions.torch_ocr import DocumentExtractionService, _open_image
+
+    started = time.perf_counter()
+    service = DocumentExtractionService(
+        det_arch=args["det_arch"],
+        reco_arch=args["reco_arch"],
+        assume_straight_pages=args["assume_straight_pages"],
+        backend=args["backend"],
+    )
+    load_seconds = time.perf_counter() - started
+
+    latencies: List[float] = []
+    predicted: List[str] = []
+    for _ in range(args["repeat"]):
+        started = time.perf_counter()
+        if document.file_type == "application/pdf":
+            predicted = [page.text for window in service.stream_pdf(document.content, args["window"]) for page in window]
+        else:
+            image = service._preprocess_image(_open_image(document.content))
+            predicted, _ = service._recognise([image], [0.3])
+        latencies.append(time.perf_counter() - started)
+
+    pages = len(document.pages)
+    queue.put({
+        "case": document.name,
+        "backend": args["backend"],
+        "pages": pages,
+        "dpi": document.dpi,
+        "model_load_seconds": round(load_seconds, 3),
+        "registry": registry.stats()["predictors"],
+        "pages_per_second": round(pages * len(latencies) / sum(latencies), 3),
+        "latency_seconds": {
+            "p50": round(float(np.percentile(latencies, 50)), 3),
+            "p90": round(float(np.percentile(latencies, 90)), 3),
+            "p99": round(float(np.percentile(latencies, 99)), 3),
+            "max": round(max(latencies), 3),
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "straight_pages": service.stats["straight_pages"],
+        "rotated_pages": service.stats["rotated_pages"],
+        "char_accuracy": round(char_accuracy(document.pages, predicted), 4),
+    })
+
+
+def compare_backends(results: List[Dict[str, Any]], backends: List[str]) -> List[Dict[str, Any]]:
+    """Speed-up and accuracy change of every backend against the first one, over the cases both completed."""
+    by_case = {(r["backend"], r["case"]): r for r in results if "pages_per_second" in r}
+    baseline = backends[0]
+    comparison = []
+    for backend in backends:
+        cases = [case for (b, case) in by_case if b == backend and (baseline, case) in by_case]
+        if not cases:
+            continue
+        speedups = [by_case[(backend, c)]["pages_per_second"] / by_case[(baseline, c)]["pages_per_second"] for c in cases]
+        accuracy = [by_case[(backend, c)]["char_accuracy"] for c in cases]
+        baseline_accuracy = [by_case[(baseline, c)]["char_accuracy"] for c in cases]
+        comparison.append({
+            "backend": backend,
+            "cases": len(cases),
+            "geomean_speedup": round(float(np.exp(np.mean(np.log(speedups)))), 3),
+            "mean_char_accuracy": round(float(np.mean(accuracy)), 4),
+            "char_accuracy_delta": round(float(np.mean(accuracy) - np.mean(baseline_accuracy)), 4),
+            "peak_rss_mb": max(by_case[(backend, c)]["peak_rss_mb"] for c in cases),
+        })
+    return comparison
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--dpi", type=int, nargs="+", default=[100, 150, 200])
+    parser.add_argument("--images", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--window", type=int, default=8)
+    parser.add_argument("--det-arch", default="db_resnet50")
+    parser.add_argument("--reco-arch", default="crnn_vgg16_bn")
+    parser.add_argument("--assume-straight-pages", action="store_true")
+    parser.add_argument(
+        "--backends", nargs="+", default=["torch", "torch-int8"], choices=BACKENDS,
+        help="Run every case on each backend and compare them against the first one",
+    )
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    documents = [make_pdf(pages, dpi) for pages in args.pages for dpi in args.dpi]
+    if args.images:
+        documents += [make_image(dpi) for dpi in args.dpi]
+
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for backend in args.backends:
+        for document in documents:
+            queue = ctx.Queue()
+            process = ctx.Process(target=run_case, args=(document, {**vars(args), "backend": backend}, queue))
+            process.start()
+            process.join()
+            if process.exitcode == 0:
+                results.append(queue.get())
+            else:
+                results.append({"case": document.name, "backend": backend, "exitcode": process.exitcode})
+            print(json.dumps(results[-1]), file=sys.stderr, flush=True)
+
+    report = {
+        "config": vars(args),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": multiprocessing.cpu_count()},
+        "results": results,
+        "comparison": compare_backends(results, args.backends),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
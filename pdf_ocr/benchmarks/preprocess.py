@@ -0,0 +1,106 @@
+"""Time and peak memory of image contrast normalisation.
+
+Run from the pdf_ocr folder:
+
+    poetry run python -m benchmarks.preprocess --megapixels 1 10 40 --image scan.png
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from typing import Callable, Dict, Optional
+
+import numpy as np
+from numpy.typing import NDArray
+from PIL import Image
+
+from src.functions.ocr.preprocess import contrast_stretch, contrast_stretch_batch, estimate_percentiles
+
+
+def reference_stretch(img: NDArray[np.uint8]) -> NDArray[np.uint8]:
+    # Implementation before the lookup table path, kept for comparison
+    p2, p98 = np.percentile(img, (2, 98))
+    img = np.clip(img, p2, p98)
+    return ((img - p2) / (p98 - p2) * 255).astype(np.uint8)
+
+
+def synthetic_scan(megapixels: float, seed: int = 0) -> NDArray[np.uint8]:
+    side = int((megapixels * 1e6) ** 0.5)
+    rng = np.random.default_rng(seed)
+    # Low-contrast grey page, the case the stretch is meant for
+    return rng.normal(150, 25, (side, side, 3)).clip(0, 255).astype(np.uint8)
+
+
+def colour_scan(height: int, width: int, seed: int = 0) -> NDArray[np.uint8]:
+    # Channels with different ranges, like a colour form or a scan with a coloured cast.
+    # Catches estimates that only look at one channel, which i.i.d. noise would hide
+    rng = np.random.default_rng(seed)
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    base = rng.normal(0, 8, (height, width))
+    for channel, mean in enumerate((60, 140, 220)):
+        img[..., channel] = (base + mean).clip(0, 255)
+    # Dark text lines across all channels
+    img[height // 10::height // 20, :, :] = 20
+    return img
+
+
+def measure(fn: Callable[..., object], repeat: int, setup: Optional[Callable[[], object]] = None) -> Dict[str, float]:
+    timings = []
+    peak = 0
+    for _ in range(repeat):
+        # The setup result, e.g. a fresh copy for an in-place call, is made outside the timer
+        args = (setup(),) if setup else ()
+        tracemalloc.start()
+        started = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - started)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {"best_ms": round(min(timings) * 1000, 2), "peak_mb": round(peak / 2**20, 1)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[1, 10, 40])
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--image", default="screenshot-run.png", help="A real scan or screenshot to check against np.percentile")
+    args = parser.parse_args()
+
+    images = {}
+    for megapixels in args.megapixels:
+        images[f"grey_{megapixels}mp"] = synthetic_scan(megapixels)
+    # A4 at 300 dpi
+    images["colour_a4_300dpi"] = colour_scan(3508, 2480)
+    if args.image:
+        images[args.image] = np.array(Image.open(args.image).convert("RGB"))
+
+    results = []
+    for name, img in images.items():
+        expected = reference_stretch(img)
+        diff = np.abs(expected.astype(np.int16) - contrast_stretch(img.copy())).max()
+        results.append({
+            "image": name,
+            "megapixels": round(img.shape[0] * img.shape[1] / 1e6, 1),
+            "image_mb": round(img.nbytes / 2**20, 1),
+            "percentiles": [int(p) for p in np.percentile(img, (2, 98))],
+            "estimated_percentiles": list(estimate_percentiles(img)),
+            "reference": measure(lambda: reference_stretch(img), args.repeat),
+            # contrast_stretch works in place, every repeat stretches a fresh copy
+            "lut": measure(contrast_stretch, args.repeat, setup=img.copy),
+            "max_abs_diff": int(diff),
+        })
+
+    small = [synthetic_scan(1, seed) for seed in range(args.batch)]
+    results.append({
+        "batch": args.batch,
+        "megapixels": 1,
+        "reference": measure(lambda: [reference_stretch(i) for i in small], args.repeat),
+        "lut": measure(contrast_stretch_batch, args.repeat, setup=lambda: [i.copy() for i in small]),
+    })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
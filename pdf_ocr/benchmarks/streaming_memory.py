@@ -0,0 +1,78 @@
+"""Peak memory of full-document vs page-windowed OCR.
+
+Run from the pdf_ocr folder:
+
+    poetry run python -m benchmarks.streaming_memory --pages 10 50 150 300 --window 8
+
+Every measurement runs in a fresh process so ru_maxrss only reflects that run.
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import sys
+import time
+
+from .corpus import make_pdf
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def run_once(mode: str, content: bytes, window: int, queue: multiprocessing.Queue) -> None:
+    from doctr.io import DocumentFile
+    from src.functions.ocr.columnar import ColumnarOcrResult
+    from src.functions.torch_ocr import DocumentExtractionService
+
+    service = DocumentExtractionService()
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+
+    if mode == "full":
+        result = service.predictor(DocumentFile.from_pdf(content))
+        pages = ColumnarOcrResult.from_document(result).page_texts()
+    else:
+        pages = [page.text for window_pages in service.stream_pdf(content, window) for page in window_pages]
+
+    queue.put(
+        {
+            "mode": mode,
+            "pages": len(pages),
+            "seconds": round(time.perf_counter() - started, 2),
+            "model_rss_mb": round(baseline, 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 50, 150, 300])
+    parser.add_argument("--window", type=int, default=8)
+    parser.add_argument("--modes", nargs="+", default=["full", "windowed"], choices=["full", "windowed"])
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for page_count in args.pages:
+        content = make_pdf(page_count).content
+        for mode in args.modes:
+            queue = ctx.Queue()
+            process = ctx.Process(target=run_once, args=(mode, content, args.window, queue))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                # The full render is expected to be OOM-killed on large documents
+                results.append({"mode": mode, "pages": page_count, "exitcode": process.exitcode})
+            else:
+                results.append(queue.get())
+            print(json.dumps(results[-1]), flush=True)
+
+    print(json.dumps({"window": args.window, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
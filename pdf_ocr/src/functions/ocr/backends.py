@@ -0,0 +1,57 @@
+from typing import Any
+
+# torch:      doctr float32 models
+# torch-int8: doctr models with the recognition model's Linear and LSTM layers dynamically quantised to int8
+# onnx:       the same architectures exported to ONNX Runtime (onnxtr)
+# onnx-int8:  the ONNX models with int8 weights
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+
+def build_predictor(det_arch: str, reco_arch: str, assume_straight_pages: bool, backend: str) -> Any:
+    """Build an OCR predictor. Every backend takes a list of page arrays and returns a doctr-style Document."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown OCR backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+
+    if backend.startswith("onnx"):
+        try:
+            from onnxtr.models import ocr_predictor as onnx_ocr_predictor
+        except ImportError as e:
+            raise RuntimeError(
+                f"The {backend} OCR backend needs onnxtr, install it with `poetry install --extras onnx`"
+            ) from e
+        return onnx_ocr_predictor(
+            det_arch=det_arch,
+            reco_arch=reco_arch,
+            assume_straight_pages=assume_straight_pages,
+            load_in_8_bit=backend == "onnx-int8",
+        )
+
+    # Imported here so ONNX-only workers never load torch
+    from doctr.models import ocr_predictor
+
+    predictor = ocr_predictor(
+        det_arch=det_arch,
+        reco_arch=reco_arch,
+        pretrained=True,
+        assume_straight_pages=assume_straight_pages,
+    )
+    if backend == "torch-int8":
+        import torch
+
+        # Dynamic quantisation only covers Linear and recurrent layers. The detection
+        # model is all convolutions and stays float32, only recognition is quantised.
+        reco = predictor.reco_predictor
+        reco.model = torch.ao.quantization.quantize_dynamic(reco.model, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8)
+    return predictor
+
+
+def build_orientation_classifier(backend: str) -> Any:
+    """Small page orientation model (0, 90, 180 or -90 degrees) matching the backend."""
+    if backend.startswith("onnx"):
+        from onnxtr.models import page_orientation_predictor
+
+        return page_orientation_predictor(load_in_8_bit=backend == "onnx-int8")
+
+    from doctr.models import page_orientation_predictor
+
+    return page_orientation_predictor(pretrained=True)
@@ -0,0 +1,199 @@
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import numpy as np
+from numpy.typing import NDArray
+
+PAGE_BREAK = "\n\n=== PAGE BREAK ===\n\n"
+
+# (page, block, line, value, confidence, geometry)
+_Word = Tuple[int, int, int, str, float, Any]
+
+
+def _bbox(geometry: Any) -> Tuple[float, float, float, float]:
+    # Straight pages give ((xmin, ymin), (xmax, ymax)), rotated ones a 4-point polygon
+    points = np.asarray(geometry, dtype=np.float32).reshape(-1, 2)
+    xmin, ymin = points.min(axis=0)
+    xmax, ymax = points.max(axis=0)
+    return float(xmin), float(ymin), float(xmax), float(ymax)
+
+
+def _gather(buffer: NDArray[np.uint8], starts: NDArray[np.int64], lengths: NDArray[np.int64]) -> bytes:
+    """Concatenate buffer[start:start + length] for every slice without a Python loop."""
+    total = int(lengths.sum())
+    if total == 0:
+        return b""
+    ends = np.cumsum(lengths)
+    # Position of every output byte in the buffer: a ramp restarted at each slice start
+    shift = np.repeat(starts - (ends - lengths), lengths)
+    return buffer[np.arange(total) + shift].tobytes()
+
+
+@dataclass
+class ColumnarOcrResult:
+    """Flat, column-per-field view of an OCR result, one row per word.
+
+    Word i is `data[offsets[i]:offsets[i + 1]]` (UTF-8). Boxes are relative
+    (xmin, ymin, xmax, ymax). Line ids are unique across the whole document.
+    """
+
+    data: bytes
+    offsets: NDArray[np.int64]
+    confidence: NDArray[np.float32]
+    boxes: NDArray[np.float32]
+    page: NDArray[np.int32]
+    block: NDArray[np.int32]
+    line: NDArray[np.int32]
+    page_count: int
+
+    @classmethod
+    def _from_words(cls, words: Iterable[_Word], page_count: int) -> "ColumnarOcrResult":
+        encoded: List[bytes] = []
+        columns: List[Tuple[int, int, int, float, Tuple[float, float, float, float]]] = []
+        for page, block, line, value, confidence, geometry in words:
+            encoded.append(value.encode())
+            columns.append((page, block, line, confidence, _bbox(geometry)))
+
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(word) for word in encoded], out=offsets[1:])
+        return cls(
+            data=b"".join(encoded),
+            offsets=offsets,
+            confidence=np.array([c[3] for c in columns], dtype=np.float32),
+            boxes=np.array([c[4] for c in columns], dtype=np.float32).reshape(-1, 4),
+            page=np.array([c[0] for c in columns], dtype=np.int32),
+            block=np.array([c[1] for c in columns], dtype=np.int32),
+            line=np.array([c[2] for c in columns], dtype=np.int32),
+            page_count=page_count,
+        )
+
+    @classmethod
+    def from_document(cls, document: Any) -> "ColumnarOcrResult":
+        """Build from a doctr Document without going through `export()`."""
+        def words() -> Iterator[_Word]:
+            line_id = 0
+            for page_idx, page in enumerate(document.pages):
+                for block_idx, block in enumerate(page.blocks):
+                    for line in block.lines:
+                        for word in line.words:
+                            yield page_idx, block_idx, line_id, word.value, word.confidence, word.geometry
+                        line_id += 1
+
+        return cls._from_words(words(), len(document.pages))
+
+    @classmethod
+    def from_export(cls, pages: List[Mapping[str, Any]]) -> "ColumnarOcrResult":
+        """Build from the `pages` list of a doctr `Document.export()`."""
+        def words() -> Iterator[_Word]:
+            line_id = 0
+            for page_idx, page in enumerate(pages):
+                for block_idx, block in enumerate(page["blocks"]):
+                    for line in block["lines"]:
+                        for word in line["words"]:
+                            yield page_idx, block_idx, line_id, word["value"], word["confidence"], word["geometry"]
+                        line_id += 1
+
+        return cls._from_words(words(), len(pages))
+
+    def __len__(self) -> int:
+        return len(self.confidence)
+
+    def word(self, index: int) -> str:
+        return self.data[self.offsets[index]:self.offsets[index + 1]].decode()
+
+    def words(self) -> List[str]:
+        return [self.word(index) for index in range(len(self))]
+
+    def select(self, mask: NDArray[np.bool_]) -> "ColumnarOcrResult":
+        indices = np.flatnonzero(mask)
+        starts = self.offsets[:-1][indices]
+        lengths = self.offsets[1:][indices] - starts
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return ColumnarOcrResult(
+            data=_gather(np.frombuffer(self.data, dtype=np.uint8), starts, lengths),
+            offsets=offsets,
+            confidence=self.confidence[indices],
+            boxes=self.boxes[indices],
+            page=self.page[indices],
+            block=self.block[indices],
+            line=self.line[indices],
+            page_count=self.page_count,
+        )
+
+    def above(self, confidence_threshold: float) -> "ColumnarOcrResult":
+        return self.select(self.confidence > confidence_threshold)
+
+    def within(
+        self, region: Tuple[float, float, float, float], page: Optional[int] = None
+    ) -> "ColumnarOcrResult":
+        """Words whose centre lies inside the relative (xmin, ymin, xmax, ymax) region."""
+        xmin, ymin, xmax, ymax = region
+        cx = (self.boxes[:, 0] + self.boxes[:, 2]) / 2
+        cy = (self.boxes[:, 1] + self.boxes[:, 3]) / 2
+        mask = (cx >= xmin) & (cx <= xmax) & (cy >= ymin) & (cy <= ymax)
+        if page is not None:
+            mask &= self.page == page
+        return self.select(mask)
+
+    def to_text(self, confidence_threshold: Optional[float] = None) -> str:
+        """Page-break-separated text, same layout as the dict-walking implementation.
+
+        Words of a line are joined by spaces, lines by newlines, and every page
+        gets a slot even when none of its words pass the threshold.
+        """
+        result = self if confidence_threshold is None else self.above(confidence_threshold)
+        if self.page_count == 0:
+            return ""
+        if len(result) == 0:
+            return PAGE_BREAK * (self.page_count - 1)
+
+        # Separators live after the word bytes, the page breaks as one run so any
+        # number of consecutive breaks is a single slice
+        breaks = PAGE_BREAK.encode() * self.page_count
+        space_at = len(result.data)
+        newline_at = space_at + 1
+        breaks_at = space_at + 2
+        buffer = np.frombuffer(result.data + b" \n" + breaks, dtype=np.uint8)
+
+        page_steps = np.diff(result.page).astype(np.int64)
+        same_line = np.diff(result.line) == 0
+        sep_starts = np.where(page_steps > 0, breaks_at, np.where(same_line, space_at, newline_at))
+        sep_lengths = np.where(page_steps > 0, page_steps * len(PAGE_BREAK), 1)
+
+        n = len(result)
+        starts = np.empty(2 * n + 1, dtype=np.int64)
+        lengths = np.empty(2 * n + 1, dtype=np.int64)
+        # Leading breaks for empty pages before the first kept word
+        starts[0], lengths[0] = breaks_at, int(result.page[0]) * len(PAGE_BREAK)
+        starts[1::2] = result.offsets[:-1]
+        lengths[1::2] = np.diff(result.offsets)
+        starts[2:-1:2], lengths[2:-1:2] = sep_starts, sep_lengths
+        # Trailing breaks for empty pages after the last kept word
+        starts[-1], lengths[-1] = breaks_at, (self.page_count - 1 - int(result.page[-1])) * len(PAGE_BREAK)
+
+        return _gather(buffer, starts, lengths).decode()
+
+    def page_confidence(self, confidence_threshold: float) -> List[Mapping[str, Any]]:
+        """Per-page word count, mean and min confidence, and words below the threshold."""
+        pages = self.page_count
+        words = np.bincount(self.page, minlength=pages)
+        totals = np.bincount(self.page, weights=self.confidence, minlength=pages)
+        below = np.bincount(self.page[self.confidence <= confidence_threshold], minlength=pages)
+        minimum = np.full(pages, np.inf, dtype=np.float32)
+        np.minimum.at(minimum, self.page, self.confidence)
+        return [
+            {
+                "words": int(words[i]),
+                "mean": round(float(totals[i] / words[i]), 4) if words[i] else None,
+                "min": round(float(minimum[i]), 4) if words[i] else None,
+                "below_threshold": int(below[i]),
+            }
+            for i in range(pages)
+        ]
+
+    def page_texts(self, confidence_threshold: Optional[float] = None) -> List[str]:
+        if self.page_count == 0:
+            return []
+        # Words never contain newlines, so the break marker cannot occur inside a page
+        return self.to_text(confidence_threshold).split(PAGE_BREAK)
@@ -0,0 +1,47 @@
+import hashlib
+import os
+import tempfile
+from typing import BinaryIO, Tuple
+
+import httpx
+
+# Downloads larger than this are spooled to a temporary file instead of memory
+DOWNLOAD_SPOOL_BYTES = int(os.getenv("OCR_DOWNLOAD_SPOOL_BYTES", str(32 * 2**20)))
+DOWNLOAD_CHUNK_BYTES = 2**20
+DOWNLOAD_TIMEOUT_SECONDS = 60.0
+
+
+async def _download(url: str, sink: BinaryIO) -> str:
+    digest = hashlib.sha256()
+    async with httpx.AsyncClient(timeout=DOWNLOAD_TIMEOUT_SECONDS) as client:
+        async with client.stream("GET", url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_BYTES):
+                digest.update(chunk)
+                sink.write(chunk)
+    sink.flush()
+    sink.seek(0)
+    return digest.hexdigest()
+
+
+async def download_to_spool(url: str) -> Tuple[tempfile.SpooledTemporaryFile, str]:
+    """Stream `url` into a spooled temp file, returning it rewound with its sha256."""
+    spool = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_BYTES)
+    try:
+        return spool, await _download(url, spool)
+    except BaseException:
+        spool.close()
+        raise
+
+
+async def download_to_file(url: str) -> Tuple[BinaryIO, str]:
+    """Stream `url` into a named temp file on disk, for workers that open it by `.name`.
+
+    The file is removed when it is closed.
+    """
+    file = tempfile.NamedTemporaryFile(prefix="ocr-", suffix=os.path.splitext(url)[1])
+    try:
+        return file, await _download(url, file)
+    except BaseException:
+        file.close()
+        raise
@@ -0,0 +1,175 @@
+import asyncio
+import contextvars
+import multiprocessing
+import os
+import queue
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from .registry import registry
+
+T = TypeVar("T")
+
+# "thread" shares the warm predictors of this process, "process" gives each worker its own copy
+OCR_EXECUTOR = os.getenv("OCR_EXECUTOR", "thread")
+# Number of documents recognised at the same time, further calls wait for a free worker
+OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", "2"))
+# Torch intra-op threads per process, leave unset to use every core
+OCR_TORCH_THREADS = os.getenv("OCR_TORCH_THREADS")
+# How often a call waiting for a free worker heartbeats
+OCR_QUEUE_HEARTBEAT_SECONDS = float(os.getenv("OCR_QUEUE_HEARTBEAT_SECONDS", "30"))
+
+if OCR_EXECUTOR not in ("thread", "process"):
+    raise ValueError(f"OCR_EXECUTOR must be 'thread' or 'process', got {OCR_EXECUTOR!r}")
+
+
+class OcrCancelled(Exception):
+    """Raised by OCR work that saw its `cancelled` event set, nobody awaits its result any more."""
+
+
+def _init_worker() -> None:
+    if OCR_TORCH_THREADS:
+        import torch
+
+        torch.set_num_threads(int(OCR_TORCH_THREADS))
+    registry.warm_up()
+
+
+def _worker_stats() -> Dict[str, Any]:
+    return registry.stats()
+
+
+class OcrExecutor:
+    """Runs blocking OCR work off the event loop with a bounded number of workers."""
+
+    def __init__(self, kind: str = OCR_EXECUTOR, max_workers: int = OCR_MAX_WORKERS) -> None:
+        self.kind = kind
+        self.max_workers = max_workers
+        self._executor: Optional[Executor] = None
+        self._manager: Optional[Any] = None
+        # Calls wait here rather than inside the pool, so waiting stays cancellable and a
+        # slot is only freed once the worker itself is done
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def uses_processes(self) -> bool:
+        return self.kind == "process"
+
+    def _get(self) -> Executor:
+        if self._executor is None:
+            if self.uses_processes:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="ocr"
+                )
+        return self._executor
+
+    def warm_up(self) -> List[Dict[str, Any]]:
+        """Load predictors before the service accepts work and return their stats."""
+        if not self.uses_processes:
+            _init_worker()
+            return [registry.stats()]
+        executor = self._get()
+        futures = [executor.submit(_worker_stats) for _ in range(self.max_workers)]
+        return [future.result() for future in futures]
+
+    def _manager_proxy(self) -> Any:
+        # Plain queues and events cannot be handed to pool workers, manager proxies can
+        if self._manager is None:
+            self._manager = multiprocessing.get_context("spawn").Manager()
+        return self._manager
+
+    def _updates_queue(self) -> Any:
+        if not self.uses_processes:
+            return queue.SimpleQueue()
+        return self._manager_proxy().Queue()
+
+    def _cancel_event(self) -> Any:
+        if not self.uses_processes:
+            return threading.Event()
+        return self._manager_proxy().Event()
+
+    async def _acquire_slot(self, heartbeat: Optional[Callable[..., None]]) -> None:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_workers)
+        while True:
+            try:
+                await asyncio.wait_for(self._slots.acquire(), OCR_QUEUE_HEARTBEAT_SECONDS)
+                return
+            except asyncio.TimeoutError:
+                # Still queued behind other documents, not stuck
+                if heartbeat is not None:
+                    heartbeat("queued")
+
+    def _release(self, future: asyncio.Future) -> None:
+        self._slots.release()
+        # A cancelled caller no longer awaits the result, retrieve OcrCancelled here
+        if not future.cancelled():
+            future.exception()
+
+    async def run(
+        self,
+        fn: Callable[..., T],
+        *args: Any,
+        on_progress: Optional[Callable[[Any], Awaitable[None]]] = None,
+        heartbeat: Optional[Callable[..., None]] = None,
+    ) -> T:
+        """Run `fn(*args, cancelled=...)` on a worker.
+
+        `cancelled` is an event set when the awaiting call is cancelled, e.g. on a
+        function timeout. `fn` checks it between units of work and raises
+        `OcrCancelled`, so abandoned calls do not keep holding a worker.
+        `heartbeat` is called while the call waits for a free worker.
+
+        With `on_progress`, `fn` also receives a queue as its last positional
+        argument and everything it puts there (never None) is passed to
+        `on_progress` on the event loop, in order, while the work is still running.
+        """
+        loop = asyncio.get_running_loop()
+        await self._acquire_slot(heartbeat)
+        try:
+            updates = None
+            if on_progress is not None:
+                updates = self._updates_queue()
+                args = (*args, updates)
+            cancelled = self._cancel_event()
+            call = partial(fn, *args, cancelled=cancelled)
+            if not self.uses_processes:
+                # Keep the function context (logger, activity info) inside the worker thread
+                call = partial(contextvars.copy_context().run, call)
+            future = loop.run_in_executor(self._get(), call)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is released when the worker is done, not when the caller stops waiting
+        future.add_done_callback(self._release)
+        try:
+            if updates is None:
+                return await future
+
+            # The worker is done putting updates once its future resolves, None marks the end
+            future.add_done_callback(lambda _: updates.put(None))
+            while (update := await asyncio.to_thread(updates.get)) is not None:
+                await on_progress(update)
+            return await future
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+
+ocr_executor = OcrExecutor()
@@ -0,0 +1,58 @@
+import os
+from typing import Any, List, Sequence
+
+import numpy as np
+from numpy.typing import NDArray
+from PIL import Image
+
+# Pages whose text lines are within this many degrees of horizontal use the straight predictor
+STRAIGHT_TOLERANCE_DEGREES = float(os.getenv("OCR_STRAIGHT_TOLERANCE_DEGREES", "1.0"))
+# The page orientation classifier must be at least this sure a page is upright
+UPRIGHT_MIN_CONFIDENCE = float(os.getenv("OCR_UPRIGHT_MIN_CONFIDENCE", "0.8"))
+
+# Skew is measured on a small greyscale copy of the page
+ESTIMATE_MAX_SIDE = 512
+SKEW_SEARCH_DEGREES = 10.0
+
+
+def _small_grey(page: NDArray[np.uint8]) -> Image.Image:
+    image = Image.fromarray(page).convert("L")
+    image.thumbnail((ESTIMATE_MAX_SIDE, ESTIMATE_MAX_SIDE), Image.Resampling.BILINEAR)
+    return image
+
+
+def _profile_score(ink: Image.Image, angle: float) -> float:
+    # Horizontal text lines give sharply alternating row sums once the page is level
+    rows = np.asarray(ink.rotate(angle, resample=Image.Resampling.NEAREST, expand=False), dtype=np.float32).sum(axis=1)
+    return float(np.square(np.diff(rows)).sum())
+
+
+def estimate_skew(page: NDArray[np.uint8]) -> float:
+    """Skew of the text lines in degrees, by projection-profile search on a thumbnail."""
+    grey = _small_grey(page)
+    # Dark pixels become ink, whatever the page contrast
+    threshold = float(np.asarray(grey).mean()) * 0.8
+    ink = grey.point(lambda value: 255 if value < threshold else 0)
+
+    # Coarse search over whole degrees, then refine around the best one
+    coarse = np.arange(-SKEW_SEARCH_DEGREES, SKEW_SEARCH_DEGREES + 1, 1.0)
+    best = max(coarse, key=lambda angle: _profile_score(ink, angle))
+    fine = np.arange(best - 1, best + 1.01, 0.25)
+    best = max(fine, key=lambda angle: _profile_score(ink, angle))
+    return float(-best)
+
+
+def straight_pages(
+    pages: Sequence[NDArray[np.uint8]],
+    orientation_classifier: Any,
+    tolerance: float = STRAIGHT_TOLERANCE_DEGREES,
+) -> List[bool]:
+    """Which pages are upright and level enough for the straight-page predictor."""
+    if not pages:
+        return []
+    # doctr page orientation classifier: [class indices, angles, confidences]
+    _, angles, confidences = orientation_classifier(list(pages))
+    return [
+        angle == 0 and confidence >= UPRIGHT_MIN_CONFIDENCE and abs(estimate_skew(page)) <= tolerance
+        for page, angle, confidence in zip(pages, angles, confidences)
+    ]
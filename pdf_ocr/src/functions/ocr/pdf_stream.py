@@ -0,0 +1,125 @@
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, List, Optional, Union
+
+import numpy as np
+import pypdfium2 as pdfium
+import pypdfium2.raw as pdfium_c
+from numpy.typing import NDArray
+
+# Same rendering settings as doctr's DocumentFile.from_pdf
+PDF_RENDER_SCALE = 2
+
+USE_TEXT_LAYER = os.getenv("OCR_TEXT_LAYER", "true").lower() == "true"
+# A text layer shorter than this is treated as missing (page numbers, stamps, ...)
+TEXT_LAYER_MIN_CHARS = int(os.getenv("OCR_TEXT_LAYER_MIN_CHARS", "32"))
+# Pages mostly covered by images are scans, even if they carry some text
+TEXT_LAYER_MAX_IMAGE_COVERAGE = float(os.getenv("OCR_TEXT_LAYER_MAX_IMAGE_COVERAGE", "0.5"))
+# Share of readable characters below which the layer is considered broken (missing ToUnicode maps, ...)
+TEXT_LAYER_MIN_READABLE_RATIO = 0.8
+
+# PDFium is not thread-safe, not even across separate documents, and pypdfium2 releases
+# the GIL on every call. All PDFium work of this process goes through this lock, the
+# recognition of a window runs outside it.
+PDFIUM_LOCK = threading.Lock()
+
+_WHITESPACE = re.compile(r"[ \t\f\v]+")
+
+
+@dataclass
+class PdfPage:
+    index: int
+    # Native text when the page has a usable text layer, otherwise the rendered image
+    text: Optional[str] = None
+    image: Optional[NDArray[np.uint8]] = None
+    # Pages in the whole document, for progress reporting
+    page_count: int = 0
+
+
+def _normalise_text(raw: str) -> str:
+    # Match the predictor output: one line per text line, words separated by single spaces
+    lines = (_WHITESPACE.sub(" ", line).strip() for line in raw.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def _image_coverage(page: pdfium.PdfPage) -> float:
+    width, height = page.get_size()
+    if width <= 0 or height <= 0:
+        return 0.0
+    covered = 0.0
+    for obj in page.get_objects(filter=[pdfium_c.FPDF_PAGEOBJ_IMAGE]):
+        left, bottom, right, top = obj.get_pos()
+        covered += max(0.0, right - left) * max(0.0, top - bottom)
+    return min(1.0, covered / (width * height))
+
+
+def extract_text_layer(page: pdfium.PdfPage, min_chars: int = TEXT_LAYER_MIN_CHARS) -> Optional[str]:
+    """Return the page's native text if it is good enough to skip OCR, else None."""
+    textpage = page.get_textpage()
+    try:
+        text = _normalise_text(textpage.get_text_bounded())
+    finally:
+        textpage.close()
+
+    chars = [c for c in text if not c.isspace()]
+    if len(chars) < min_chars:
+        return None
+    readable = sum(1 for c in chars if c.isprintable() and c != "\ufffd")
+    if readable / len(chars) < TEXT_LAYER_MIN_READABLE_RATIO:
+        return None
+    if _image_coverage(page) > TEXT_LAYER_MAX_IMAGE_COVERAGE:
+        return None
+    return text
+
+
+def iter_page_windows(
+    content: Union[bytes, str, BinaryIO],
+    window_size: int,
+    scale: float = PDF_RENDER_SCALE,
+    use_text_layer: bool = USE_TEXT_LAYER,
+) -> Iterator[List[PdfPage]]:
+    """Walk a PDF lazily, yielding at most `window_size` pages at a time.
+
+    Only the current window is alive, so peak memory depends on the window size
+    and not on the page count of the document. A window size of 0 yields the whole
+    document at once. Pages with a usable text layer are not rasterised at all.
+    """
+    if window_size < 0:
+        raise ValueError("window_size must not be negative")
+
+    with PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(content)
+        page_count = len(pdf)
+    try:
+        window_size = window_size or page_count
+        window: List[PdfPage] = []
+        for index in range(page_count):
+            with PDFIUM_LOCK:
+                window.append(_load_page(pdf, index, page_count, scale, use_text_layer))
+            if len(window) == window_size:
+                yield window
+                window = []
+        if window:
+            yield window
+    finally:
+        with PDFIUM_LOCK:
+            pdf.close()
+
+
+def _load_page(pdf: pdfium.PdfDocument, index: int, page_count: int, scale: float, use_text_layer: bool) -> PdfPage:
+    # Caller holds PDFIUM_LOCK
+    page = pdf[index]
+    try:
+        text = extract_text_layer(page) if use_text_layer else None
+        if text is not None:
+            return PdfPage(index=index, text=text, page_count=page_count)
+        bitmap = page.render(scale=scale, rev_byteorder=True)
+        # to_numpy is a view on the PDFium bitmap. Copy it and free the bitmap here, so it
+        # is not released by the garbage collector later on some thread outside the lock.
+        image = bitmap.to_numpy().copy()
+        bitmap.close()
+        return PdfPage(index=index, image=image, page_count=page_count)
+    finally:
+        page.close()
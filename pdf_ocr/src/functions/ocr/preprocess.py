@@ -0,0 +1,68 @@
+from typing import List, Sequence, Tuple, Union
+
+import numpy as np
+from numpy.typing import NDArray
+from PIL import Image
+
+# Percentiles are estimated on at most this many samples per image
+PERCENTILE_SAMPLES = 1 << 20
+# numpy widens uint8 indices to intp, so the table is applied in slices to bound that copy
+LUT_CHUNK = 1 << 20
+
+
+def _as_rgb_array(image: Union[Image.Image, NDArray[np.uint8]]) -> NDArray[np.uint8]:
+    if isinstance(image, Image.Image):
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        return np.array(image)
+    if not image.flags.writeable:
+        return image.copy()
+    # Contiguous so the in-place table lookup can walk a flat view
+    return np.ascontiguousarray(image)
+
+
+def estimate_percentiles(
+    img: NDArray[np.uint8], low: float = 2, high: float = 98, samples: int = PERCENTILE_SAMPLES
+) -> Tuple[int, int]:
+    """Percentiles of a uint8 image from a histogram of a strided subsample of its pixels."""
+    # Stride over whole pixels, striding the flat buffer with a multiple of the
+    # channel count would sample a single channel
+    pixels = img.reshape(-1, img.shape[-1]) if img.ndim == 3 else img.reshape(-1, 1)
+    step = max(1, pixels.size // samples)
+    hist = np.bincount(pixels[::step].reshape(-1), minlength=256)
+    cdf = np.cumsum(hist)
+    total = cdf[-1]
+    p_low = int(np.searchsorted(cdf, total * low / 100, side="left"))
+    p_high = int(np.searchsorted(cdf, total * high / 100, side="left"))
+    return p_low, p_high
+
+
+def stretch_lut(p_low: int, p_high: int) -> NDArray[np.uint8]:
+    levels = np.clip(np.arange(256, dtype=np.float64), p_low, p_high)
+    return ((levels - p_low) * (255 / (p_high - p_low))).astype(np.uint8)
+
+
+def contrast_stretch(image: Union[Image.Image, NDArray[np.uint8]]) -> NDArray[np.uint8]:
+    """Stretch the 2nd-98th percentile range of an RGB image to 0-255.
+
+    Arrays are modified in place through a 256-entry lookup table, so no float
+    copy of the image is ever allocated.
+    """
+    img = _as_rgb_array(image)
+    p_low, p_high = estimate_percentiles(img)
+    if p_high <= p_low:
+        # Flat image, nothing to stretch
+        return img
+    lut = stretch_lut(p_low, p_high)
+    flat = img.reshape(-1)
+    for start in range(0, flat.size, LUT_CHUNK):
+        chunk = flat[start:start + LUT_CHUNK]
+        # mode="clip" keeps take unbuffered, indices are always within the table anyway
+        np.take(lut, chunk, out=chunk, mode="clip")
+    return img
+
+
+def contrast_stretch_batch(
+    images: Sequence[Union[Image.Image, NDArray[np.uint8]]],
+) -> List[NDArray[np.uint8]]:
+    return [contrast_stretch(image) for image in images]
@@ -0,0 +1,34 @@
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class PageConfidence(BaseModel):
+    # Words the predictor returned for the page, before the confidence threshold
+    words: int
+    mean: Optional[float] = None
+    min: Optional[float] = None
+    # Words dropped from the text by the confidence threshold
+    below_threshold: int = 0
+
+
+class PageProgress(BaseModel):
+    # Zero-based index of the page in the document
+    page: int
+    text: str
+    # "text_layer" when the PDF already carried the text, "cache" when the whole
+    # document came from the OCR result cache, "ocr" otherwise
+    source: str
+    confidence: Optional[PageConfidence] = None
+    # Seconds since recognition of the document started
+    elapsed_seconds: float
+
+
+class OcrProgress(BaseModel):
+    """Pages recognised since the previous update, sent to the workflow as the `ocr_pages` event."""
+
+    file_name: str
+    pages: List[PageProgress]
+    pages_done: int
+    page_count: int
+    elapsed_seconds: float
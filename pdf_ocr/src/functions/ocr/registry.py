@@ -0,0 +1,147 @@
+import os
+import resource
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from restack_ai.function import log
+
+from .backends import BACKENDS, build_orientation_classifier, build_predictor
+
+# (det_arch, reco_arch, assume_straight_pages, backend)
+PredictorKey = Tuple[str, str, bool, str]
+
+DEFAULT_DET_ARCH = os.getenv("OCR_DET_ARCH", "db_resnet50")
+DEFAULT_RECO_ARCH = os.getenv("OCR_RECO_ARCH", "crnn_vgg16_bn")
+DEFAULT_ASSUME_STRAIGHT_PAGES = os.getenv("OCR_ASSUME_STRAIGHT_PAGES", "false").lower() == "true"
+DEFAULT_BACKEND = os.getenv("OCR_BACKEND", "torch")
+DEFAULT_KEY: PredictorKey = (DEFAULT_DET_ARCH, DEFAULT_RECO_ARCH, DEFAULT_ASSUME_STRAIGHT_PAGES, DEFAULT_BACKEND)
+# Route upright pages to a straight-page predictor and keep the rotation-aware one for the rest
+AUTO_STRAIGHT_PAGES = (
+    os.getenv("OCR_AUTO_STRAIGHT_PAGES", "true").lower() == "true" and not DEFAULT_ASSUME_STRAIGHT_PAGES
+)
+
+if DEFAULT_BACKEND not in BACKENDS:
+    raise ValueError(f"OCR_BACKEND must be one of {', '.join(BACKENDS)}, got {DEFAULT_BACKEND!r}")
+
+
+def current_rss_bytes() -> int:
+    # /proc gives the live resident set; elsewhere fall back to the high-water mark
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@dataclass
+class PredictorStats:
+    load_seconds: float
+    rss_before_bytes: int
+    rss_after_bytes: int
+
+    @property
+    def rss_delta_bytes(self) -> int:
+        return self.rss_after_bytes - self.rss_before_bytes
+
+
+class PredictorRegistry:
+    """Process-wide cache of doctr predictors, loaded once per configuration."""
+
+    def __init__(self) -> None:
+        self._predictors: Dict[PredictorKey, Any] = {}
+        self._stats: Dict[PredictorKey, PredictorStats] = {}
+        self._classifiers: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        det_arch: str = DEFAULT_DET_ARCH,
+        reco_arch: str = DEFAULT_RECO_ARCH,
+        assume_straight_pages: bool = DEFAULT_ASSUME_STRAIGHT_PAGES,
+        backend: str = DEFAULT_BACKEND,
+    ) -> Any:
+        key = (det_arch, reco_arch, assume_straight_pages, backend)
+        predictor = self._predictors.get(key)
+        if predictor is not None:
+            return predictor
+
+        # Only one caller loads a given configuration, the others wait and reuse it
+        with self._lock:
+            predictor = self._predictors.get(key)
+            if predictor is None:
+                predictor = self._load(key)
+        return predictor
+
+    def get_orientation_classifier(self, backend: str = DEFAULT_BACKEND) -> Any:
+        classifier = self._classifiers.get(backend)
+        if classifier is not None:
+            return classifier
+
+        with self._lock:
+            classifier = self._classifiers.get(backend)
+            if classifier is None:
+                started = time.perf_counter()
+                classifier = build_orientation_classifier(backend)
+                self._classifiers[backend] = classifier
+                log.info(
+                    "Page orientation classifier loaded",
+                    backend=backend,
+                    load_seconds=round(time.perf_counter() - started, 3),
+                )
+        return classifier
+
+    def _load(self, key: PredictorKey) -> Any:
+        det_arch, reco_arch, assume_straight_pages, backend = key
+        rss_before = current_rss_bytes()
+        started = time.perf_counter()
+
+        predictor = build_predictor(det_arch, reco_arch, assume_straight_pages, backend)
+
+        stats = PredictorStats(
+            load_seconds=time.perf_counter() - started,
+            rss_before_bytes=rss_before,
+            rss_after_bytes=current_rss_bytes(),
+        )
+        self._predictors[key] = predictor
+        self._stats[key] = stats
+        log.info(
+            "OCR predictor loaded",
+            det_arch=det_arch,
+            reco_arch=reco_arch,
+            assume_straight_pages=assume_straight_pages,
+            backend=backend,
+            load_seconds=round(stats.load_seconds, 3),
+            rss_delta_mb=round(stats.rss_delta_bytes / 2**20, 1),
+            rss_mb=round(stats.rss_after_bytes / 2**20, 1),
+        )
+        return predictor
+
+    def warm_up(self, keys: Optional[Iterable[PredictorKey]] = None) -> None:
+        if keys is None:
+            keys = [DEFAULT_KEY]
+            if AUTO_STRAIGHT_PAGES:
+                # Keep both paths warm so routing a page never triggers a load
+                keys.append((DEFAULT_DET_ARCH, DEFAULT_RECO_ARCH, True, DEFAULT_BACKEND))
+                self.get_orientation_classifier(DEFAULT_BACKEND)
+        for key in keys:
+            self.get(*key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rss_bytes": current_rss_bytes(),
+            "predictors": [
+                {
+                    "det_arch": key[0],
+                    "reco_arch": key[1],
+                    "assume_straight_pages": key[2],
+                    "backend": key[3],
+                    **asdict(stats),
+                }
+                for key, stats in self._stats.items()
+            ],
+        }
+
+
+registry = PredictorRegistry()
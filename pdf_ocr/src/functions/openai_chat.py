@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from restack_ai.function import function, log, FunctionFailure
-from openai import OpenAI
+from openai import AsyncOpenAI
 import os
 from dotenv import load_dotenv
 
@@ -20,14 +20,14 @@ async def openai_chat(input: OpenAiChatInput) -> str:
         if (os.environ.get("OPENAI_API_KEY") is None):
             raise FunctionFailure("OPENAI_API_KEY is not set", non_retryable=True)
     
-        client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        client = AsyncOpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
 
         messages = []
         if input.system_content:
             messages.append({"role": "system", "content": input.system_content})
         messages.append({"role": "user", "content": input.user_content})
 
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=input.model or "gpt-4o-mini",
             messages=messages
         )
@@ -1,17 +1,41 @@
+import asyncio
 import base64
 import io
-from typing import Any, List
+import os
+import time
+from typing import Any, BinaryIO, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
-from doctr.io import DocumentFile
 from numpy.typing import NDArray
 from PIL import Image
 from pydantic import BaseModel, Field
-from restack_ai.function import function, log, FunctionFailure
+from restack_ai.function import function, log, FunctionFailure, heartbeat
 
-from doctr.models import ocr_predictor
-import requests
-from ..client import api_address
+from ..client import api_address, client
+from .ocr.registry import (
+    AUTO_STRAIGHT_PAGES,
+    DEFAULT_ASSUME_STRAIGHT_PAGES,
+    DEFAULT_BACKEND,
+    DEFAULT_DET_ARCH,
+    DEFAULT_RECO_ARCH,
+    registry,
+)
+from .ocr.pdf_stream import (
+    TEXT_LAYER_MAX_IMAGE_COVERAGE,
+    TEXT_LAYER_MIN_CHARS,
+    USE_TEXT_LAYER,
+    iter_page_windows,
+)
+from .ocr.cache import OCR_CACHE_ENABLED, cache_key, ocr_cache
+from .ocr.download import download_to_file, download_to_spool
+from .ocr.columnar import PAGE_BREAK, ColumnarOcrResult
+from .ocr.preprocess import contrast_stretch, contrast_stretch_batch
+from .ocr.executor import OcrCancelled, ocr_executor
+from .ocr.orientation import STRAIGHT_TOLERANCE_DEGREES, straight_pages
+from .ocr.progress import OcrProgress, PageConfidence, PageProgress
+
+# Number of PDF pages rasterised and recognised together, 0 processes the whole document at once
+DEFAULT_PAGE_WINDOW = int(os.getenv("OCR_PAGE_WINDOW", "8"))
 
 class OCRPrediction(BaseModel):
     pages: List[dict[str, Any]] = Field(
@@ -21,68 +45,310 @@ class OCRPrediction(BaseModel):
 class OcrInput(BaseModel):
     file_type: str
     file_name:str
+    page_window: Optional[int] = None
+    confidence_threshold: float = 0.3
+    # Workflow that receives an `ocr_pages` event as pages are recognised
+    progress_workflow_id: Optional[str] = None
+    progress_run_id: Optional[str] = None
+
+class OcrBatchInput(BaseModel):
+    files: List[OcrInput]
+
+def _download_url(file_name: str) -> str:
+    return f"{api_address or 'http://localhost:6233'}/api/download/{file_name}"
+
+def _result_cache_key(input: OcrInput, content_digest: str) -> str:
+    # Workers build DocumentExtractionService with the same module defaults, so this
+    # is the configuration that produced the text
+    return cache_key(content_digest, {
+        **extraction_config(),
+        "file_type": input.file_type,
+        "confidence_threshold": input.confidence_threshold,
+    })
+
+async def _download_source(url: str) -> Tuple[BinaryIO, str]:
+    # Worker processes cannot share an open spool, they get a file on disk and open it by path
+    if ocr_executor.uses_processes:
+        return await download_to_file(url)
+    return await download_to_spool(url)
+
+def _worker_source(source: BinaryIO) -> Union[str, BinaryIO]:
+    # Only the path is pickled for worker processes, the content never goes through memory
+    return source.name if ocr_executor.uses_processes else source
+
+def _open_image(source: Union[bytes, str, BinaryIO]) -> Image.Image:
+    return Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+
+async def _send_progress(input: OcrInput, progress: OcrProgress) -> None:
+    # Progress is best effort, the function result stays the source of truth
+    try:
+        await client.send_workflow_event(
+            event_name="ocr_pages",
+            event_input=progress.model_dump(),
+            workflow_id=input.progress_workflow_id,
+            run_id=input.progress_run_id,
+        )
+    except Exception as e:
+        log.warning(f"Failed to send OCR progress: {str(e)}", file_name=input.file_name)
+
+def _cached_progress(input: OcrInput, text: str) -> OcrProgress:
+    pages = text.split(PAGE_BREAK)
+    return OcrProgress(
+        file_name=input.file_name,
+        pages=[PageProgress(page=i, text=page, source="cache", elapsed_seconds=0.0) for i, page in enumerate(pages)],
+        pages_done=len(pages),
+        page_count=len(pages),
+        elapsed_seconds=0.0,
+    )
 
 @function.defn()
 async def torch_ocr(input: OcrInput) -> str:
     try:
-        service = DocumentExtractionService()
-
-        # Download the file from localhost
-        response = requests.get(f"{api_address or 'http://localhost:6233'}/api/download/{input.file_name}")
-        response.raise_for_status()  # Raise an error for bad responses
-        content = response.content
-
-        if input.file_type == "application/pdf":
-            doc = DocumentFile.from_pdf(content)
-        elif input.file_type.startswith("image/"):
-            image: Image.Image = Image.open(io.BytesIO(content))
-            processed_img: NDArray[np.uint8] = service._preprocess_image(image)
-            doc = DocumentFile.from_images(processed_img)
-        else:
-            raise FunctionFailure("Unsupported file type", non_retryable=True)
+        # Download the file from localhost without blocking the event loop
+        source, content_digest = await _download_source(_download_url(input.file_name))
+        with source:
+            key = None
+            if OCR_CACHE_ENABLED:
+                key = _result_cache_key(input, content_digest)
+                cached = await asyncio.to_thread(ocr_cache.get, key)
+                if cached is not None:
+                    log.info("OCR cache hit", file_name=input.file_name, **ocr_cache.counters())
+                    if input.progress_workflow_id:
+                        await _send_progress(input, _cached_progress(input, cached))
+                    return cached
+
+            async def on_window(progress: OcrProgress) -> None:
+                # Every page window proves the worker is alive, long documents outlast the heartbeat timeout otherwise
+                heartbeat(progress.pages_done)
+                if input.progress_workflow_id:
+                    await _send_progress(input, progress)
 
-        result = service.predictor(doc)
-        json_output = OCRPrediction.model_validate(result.export())
-        return service._process_predictions(json_output)
+            text = await ocr_executor.run(
+                _extract_text, input, _worker_source(source), on_progress=on_window, heartbeat=heartbeat
+            )
+
+        if key is not None:
+            await asyncio.to_thread(ocr_cache.put, key, text)
+            log.info("OCR result cached", file_name=input.file_name, **ocr_cache.counters())
+        return text
     except Exception as e:
         log.error(f"Failed to process file: {str(e)}")
         raise FunctionFailure(f"Failed to process file: {str(e)}", non_retryable=True)
 
-class DocumentExtractionService:
-    def __init__(self) -> None:
-        self.predictor = ocr_predictor(
-            det_arch="db_resnet50",
-            reco_arch="crnn_vgg16_bn",
-            pretrained=True,
-            assume_straight_pages=False,
+@function.defn()
+async def torch_ocr_batch(input: OcrBatchInput) -> List[str]:
+    """OCR several single-image uploads with one predictor call, texts in input order."""
+    try:
+        if not all(file.file_type.startswith("image/") for file in input.files):
+            raise FunctionFailure("torch_ocr_batch only accepts images", non_retryable=True)
+
+        downloads = await asyncio.gather(
+            *(_download_source(_download_url(file.file_name)) for file in input.files)
         )
+        texts: List[Optional[str]] = [None] * len(input.files)
+        keys: List[Optional[str]] = [None] * len(input.files)
+        try:
+            if OCR_CACHE_ENABLED:
+                for index, (file, (_, content_digest)) in enumerate(zip(input.files, downloads)):
+                    keys[index] = _result_cache_key(file, content_digest)
+                    texts[index] = await asyncio.to_thread(ocr_cache.get, keys[index])
+
+            misses = [index for index, text in enumerate(texts) if text is None]
+            if misses:
+                recognised = await ocr_executor.run(
+                    _extract_images,
+                    [input.files[index] for index in misses],
+                    [_worker_source(downloads[index][0]) for index in misses],
+                    heartbeat=heartbeat,
+                )
+                for index, text in zip(misses, recognised):
+                    texts[index] = text
+                    if keys[index] is not None:
+                        await asyncio.to_thread(ocr_cache.put, keys[index], text)
+        finally:
+            for source, _ in downloads:
+                source.close()
+
+        counters = ocr_cache.counters() if OCR_CACHE_ENABLED else {}
+        log.info("OCR batch completed", images=len(texts), recognised=len(misses), **counters)
+        return texts
+    except Exception as e:
+        log.error(f"Failed to process batch: {str(e)}")
+        raise FunctionFailure(f"Failed to process batch: {str(e)}", non_retryable=True)
+
+def _extract_text(
+    input: OcrInput, source: Union[bytes, str, BinaryIO], updates: Optional[Any] = None, cancelled: Optional[Any] = None
+) -> str:
+    # Runs on the OCR executor, never on the event loop. Every recognised window is
+    # also put on `updates`, the caller heartbeats and reports progress from there.
+    started = time.perf_counter()
+    service = DocumentExtractionService()
+    page_window = DEFAULT_PAGE_WINDOW if input.page_window is None else input.page_window
+
+    if input.file_type == "application/pdf":
+        windows = service.stream_pdf(source, page_window, input.confidence_threshold)
+    elif input.file_type.startswith("image/"):
+        processed_img: NDArray[np.uint8] = service._preprocess_image(_open_image(source))
+        texts, confidence = service._recognise([processed_img], [input.confidence_threshold])
+        windows = iter([[PageProgress(
+            page=0,
+            text=texts[0],
+            source="ocr",
+            confidence=confidence[0],
+            elapsed_seconds=round(time.perf_counter() - started, 3),
+        )]])
+    else:
+        raise FunctionFailure("Unsupported file type", non_retryable=True)
+
+    pages: List[str] = []
+    for index, window_pages in enumerate(windows, start=1):
+        pages.extend(page.text for page in window_pages)
+        page_count = service.page_count or len(pages)
+        log.info(
+            f"OCR window {index} completed",
+            file_name=input.file_name,
+            pages_done=len(pages),
+            page_count=page_count,
+        )
+        if updates is not None:
+            updates.put(OcrProgress(
+                file_name=input.file_name,
+                pages=window_pages,
+                pages_done=len(pages),
+                page_count=page_count,
+                elapsed_seconds=round(time.perf_counter() - started, 3),
+            ))
+        if cancelled is not None and cancelled.is_set():
+            # The function timed out or was cancelled, free the worker for queued documents
+            raise OcrCancelled(f"OCR of {input.file_name} cancelled after {len(pages)} pages")
+    log.info("OCR completed", file_name=input.file_name, **service.stats)
+    return PAGE_BREAK.join(pages)
+
+def _extract_images(
+    inputs: List[OcrInput], sources: List[Union[bytes, str, BinaryIO]], cancelled: Optional[Any] = None
+) -> List[str]:
+    # Every image is one page of a single predictor call
+    if cancelled is not None and cancelled.is_set():
+        raise OcrCancelled(f"OCR of {len(inputs)} images cancelled")
+    service = DocumentExtractionService()
+    processed = service._preprocess_images([_open_image(source) for source in sources])
+    texts, _ = service._recognise(processed, [input.confidence_threshold for input in inputs])
+    log.info("OCR batch recognised", **service.stats)
+    return texts
+
+def extraction_config(
+    det_arch: str = DEFAULT_DET_ARCH,
+    reco_arch: str = DEFAULT_RECO_ARCH,
+    assume_straight_pages: bool = DEFAULT_ASSUME_STRAIGHT_PAGES,
+    backend: str = DEFAULT_BACKEND,
+    auto_straight_pages: bool = AUTO_STRAIGHT_PAGES,
+) -> dict[str, Any]:
+    # Everything that changes the extracted text, used to address cached results
+    return {
+        "det_arch": det_arch,
+        "reco_arch": reco_arch,
+        "assume_straight_pages": assume_straight_pages,
+        "backend": backend,
+        "auto_straight_pages": auto_straight_pages and not assume_straight_pages,
+        "straight_tolerance_degrees": STRAIGHT_TOLERANCE_DEGREES,
+        "text_layer": USE_TEXT_LAYER,
+        "text_layer_min_chars": TEXT_LAYER_MIN_CHARS,
+        "text_layer_max_image_coverage": TEXT_LAYER_MAX_IMAGE_COVERAGE,
+    }
+
+
+class DocumentExtractionService:
+    def __init__(
+        self,
+        det_arch: str = DEFAULT_DET_ARCH,
+        reco_arch: str = DEFAULT_RECO_ARCH,
+        assume_straight_pages: bool = DEFAULT_ASSUME_STRAIGHT_PAGES,
+        backend: str = DEFAULT_BACKEND,
+        auto_straight_pages: bool = AUTO_STRAIGHT_PAGES,
+    ) -> None:
+        # Predictors are shared across calls, constructing a service is cheap
+        self.predictor = registry.get(det_arch, reco_arch, assume_straight_pages, backend)
+        self.straight_predictor = None
+        self.orientation_classifier = None
+        if auto_straight_pages and not assume_straight_pages:
+            self.straight_predictor = registry.get(det_arch, reco_arch, True, backend)
+            self.orientation_classifier = registry.get_orientation_classifier(backend)
+        self.stats = {"text_layer_pages": 0, "ocr_pages": 0, "straight_pages": 0, "rotated_pages": 0}
+        # Pages in the PDF being streamed, known once its first window is read
+        self.page_count = 0
 
     def _preprocess_image(self, image: Image.Image) -> NDArray[np.uint8]:
-        if image.mode != "RGB":
-            image = image.convert("RGB")
+        return contrast_stretch(image)
+
+    def _preprocess_images(self, images: List[Image.Image]) -> List[NDArray[np.uint8]]:
+        return contrast_stretch_batch(images)
+
+    def stream_pdf(
+        self, content: Union[bytes, str, BinaryIO], window_size: int, confidence_threshold: float = 0.3
+    ) -> Iterator[List[PageProgress]]:
+        # Yields the pages of each window as soon as they are recognised. Pages with
+        # a usable text layer skip the predictor entirely.
+        started = time.perf_counter()
+        for window in iter_page_windows(content, window_size):
+            self.page_count = window[0].page_count
+            images = [page.image for page in window if page.text is None]
+            texts, confidence = self._recognise(images, [confidence_threshold] * len(images))
+            recognised = iter(zip(texts, confidence))
+            self.stats["text_layer_pages"] += len(window) - len(images)
+
+            elapsed = round(time.perf_counter() - started, 3)
+            pages = []
+            for page in window:
+                if page.text is not None:
+                    pages.append(PageProgress(page=page.index, text=page.text, source="text_layer", elapsed_seconds=elapsed))
+                else:
+                    text, page_confidence = next(recognised)
+                    pages.append(PageProgress(
+                        page=page.index, text=text, source="ocr", confidence=page_confidence, elapsed_seconds=elapsed
+                    ))
+            yield pages
+
+    def _recognise(
+        self, images: List[NDArray[np.uint8]], confidence_thresholds: List[float]
+    ) -> Tuple[List[str], List[PageConfidence]]:
+        """Text and confidence stats of every image, upright pages going through the cheaper straight-page predictor."""
+        if not images:
+            return [], []
+        if self.straight_predictor is None:
+            routes = [(self.predictor, list(range(len(images))))]
+        else:
+            straight = straight_pages(images, self.orientation_classifier)
+            routes = [
+                (self.straight_predictor, [i for i, is_straight in enumerate(straight) if is_straight]),
+                (self.predictor, [i for i, is_straight in enumerate(straight) if not is_straight]),
+            ]
 
-        img_array: NDArray[np.uint8] = np.array(image)
-        p2, p98 = np.percentile(img_array, (2, 98))
-        img_array = np.clip(img_array, p2, p98)
-        img_array = ((img_array - p2) / (p98 - p2) * 255).astype(np.uint8)
+        texts: List[str] = [""] * len(images)
+        confidence: List[Optional[PageConfidence]] = [None] * len(images)
+        for predictor, indices in routes:
+            if not indices:
+                continue
+            result = ColumnarOcrResult.from_document(predictor([images[i] for i in indices]))
+            page_texts = {
+                threshold: result.page_texts(threshold)
+                for threshold in {confidence_thresholds[i] for i in indices}
+            }
+            page_confidence = {
+                threshold: result.page_confidence(threshold)
+                for threshold in {confidence_thresholds[i] for i in indices}
+            }
+            for position, i in enumerate(indices):
+                texts[i] = page_texts[confidence_thresholds[i]][position]
+                confidence[i] = PageConfidence(**page_confidence[confidence_thresholds[i]][position])
+            if predictor is self.straight_predictor:
+                self.stats["straight_pages"] += len(indices)
+            else:
+                self.stats["rotated_pages"] += len(indices)
 
-        return img_array
+        self.stats["ocr_pages"] += len(images)
+        return texts, confidence
 
     def _process_predictions(
         self, json_output: OCRPrediction, confidence_threshold: float = 0.3
     ) -> str:
-        processed_text: List[str] = []
-
-        for page in json_output.pages:
-            page_text: List[str] = []
-            for block in page["blocks"]:
-                for line in block["lines"]:
-                    line_text: List[str] = []
-                    for word in line["words"]:
-                        if word["confidence"] > confidence_threshold:
-                            line_text.append(word["value"])
-                    if line_text:
-                        page_text.append(" ".join(line_text))
-            processed_text.append("\n".join(page_text))
-
-        return "\n\n=== PAGE BREAK ===\n\n".join(processed_text)
\ No newline at end of file
+        return ColumnarOcrResult.from_export(json_output.pages).to_text(confidence_threshold)
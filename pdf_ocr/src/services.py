@@ -1,6 +1,8 @@
 import asyncio
-from src.functions.torch_ocr import torch_ocr
+from src.functions.torch_ocr import torch_ocr, torch_ocr_batch
 from src.functions.openai_chat import openai_chat
+from src.functions.ocr.executor import ocr_executor
+from src.functions.ocr.cache import OCR_CACHE_ENABLED, ocr_cache
 from src.client import client
 from src.workflows.pdf import PdfWorkflow
 from src.workflows.files import FilesWorkflow
@@ -9,11 +11,15 @@ import webbrowser
 import os
 
 async def main():
+    # Load OCR weights before accepting work so the first document is not slowed down
+    print(f"OCR predictors ready: {ocr_executor.warm_up()}")
+    if OCR_CACHE_ENABLED:
+        print(f"OCR cache: {ocr_cache.stats()}")
 
     await asyncio.gather(
       await client.start_service(
           workflows= [PdfWorkflow, FilesWorkflow],
-          functions= [torch_ocr, openai_chat]
+          functions= [torch_ocr, torch_ocr_batch, openai_chat]
       )
     )
     
@@ -0,0 +1,62 @@
+import math
+import re
+from typing import List
+
+PAGE_BREAK = "\n\n=== PAGE BREAK ===\n\n"
+
+_WORD = re.compile(r"\S+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for OpenAI models, roughly 4 characters or 0.75 words per token."""
+    return max(math.ceil(len(text) / 4), math.ceil(len(_WORD.findall(text)) * 4 / 3))
+
+
+def _split_oversized(line: str, max_tokens: int) -> List[str]:
+    # A single line longer than a chunk is cut between words
+    pieces: List[str] = []
+    current: List[str] = []
+    chars = 0
+    for word in line.split():
+        added = chars + len(word) + (1 if current else 0)
+        if current and max(math.ceil(added / 4), math.ceil((len(current) + 1) * 4 / 3)) > max_tokens:
+            pieces.append(" ".join(current))
+            current, added = [], len(word)
+        current.append(word)
+        chars = added
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+
+def chunk_text(text: str, max_tokens: int) -> List[str]:
+    """Pack pages, then lines, into chunks of at most `max_tokens` estimated tokens.
+
+    Page boundaries are preferred split points so a chunk usually covers whole
+    pages. Units packed into the same chunk are separated by a newline.
+    """
+    if max_tokens < 1:
+        raise ValueError("max_tokens must be at least 1")
+
+    units: List[str] = []
+    for page in text.split(PAGE_BREAK):
+        if estimate_tokens(page) <= max_tokens:
+            units.append(page)
+            continue
+        for line in page.split("\n"):
+            if estimate_tokens(line) <= max_tokens:
+                units.append(line)
+            else:
+                units.extend(_split_oversized(line, max_tokens))
+
+    chunks: List[str] = []
+    current = ""
+    for unit in units:
+        candidate = f"{current}\n{unit}" if current else unit
+        if current and estimate_tokens(candidate) > max_tokens:
+            chunks.append(current)
+            candidate = unit
+        current = candidate
+    if current.strip():
+        chunks.append(current)
+    return chunks or [text]
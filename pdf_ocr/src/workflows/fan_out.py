@@ -0,0 +1,37 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+
+
+async def run_windowed(
+    jobs: Sequence[Callable[[], Awaitable[T]]],
+    max_in_flight: int,
+    on_result: Optional[Callable[[int, T], None]] = None,
+) -> List[T]:
+    """Run `jobs` with at most `max_in_flight` of them started at any time.
+
+    A new job starts as soon as one finishes and `on_result` is called as results
+    arrive. Results are returned in job order. Completions are handled in job order
+    too, so the commands issued stay deterministic across workflow replays.
+    """
+    if max_in_flight < 1:
+        raise ValueError("max_in_flight must be at least 1")
+
+    results: List[Optional[T]] = [None] * len(jobs)
+    pending: dict[asyncio.Future, int] = {}
+    next_job = 0
+
+    while next_job < len(jobs) or pending:
+        while next_job < len(jobs) and len(pending) < max_in_flight:
+            pending[asyncio.ensure_future(jobs[next_job]())] = next_job
+            next_job += 1
+
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in sorted(done, key=pending.__getitem__):
+            index = pending.pop(task)
+            results[index] = task.result()
+            if on_result is not None:
+                on_result(index, results[index])
+
+    return results
@@ -1,38 +1,98 @@
-from restack_ai.workflow import workflow, log, workflow_info
-from typing import List
-from pydantic import BaseModel, Field
+from restack_ai.workflow import workflow, import_functions, log, workflow_info
 import asyncio
-from .pdf import PdfWorkflow, PdfWorkflowInput
+from datetime import timedelta
+from typing import Awaitable, Callable, List, Optional, Tuple
+from pydantic import BaseModel, Field
+from .fan_out import run_windowed
+from .pdf import PdfWorkflow, PdfWorkflowInput, summarise, summarise_prompt
+
+with import_functions():
+    from src.functions.torch_ocr import torch_ocr_batch, OcrBatchInput, OcrInput
 
 
 class FilesWorkflowInput(BaseModel):
     files_upload: List[dict] = Field(files=True)
+    # Jobs started at the same time, the next one starts as soon as one finishes.
+    # A job is one PdfWorkflow child or one batch of small images.
+    max_concurrent_children: int = 10
+    # Images up to this size are recognised and summarised in batches, without a child each
+    small_image_bytes: int = 1_000_000
+    image_batch_size: int = 16
+
+def _is_small_image(file: dict, small_image_bytes: int) -> bool:
+    size = file.get('size')
+    return file.get('type', '').startswith("image/") and size is not None and size <= small_image_bytes
 
 @workflow.defn()
 class FilesWorkflow:
     @workflow.run
     async def run(self, input: FilesWorkflowInput):
-        tasks = []
         parent_workflow_id = workflow_info().workflow_id
+        files = input.files_upload
+
+        unsized = [file.get('name') for file in files if file.get('type', '').startswith("image/") and file.get('size') is None]
+        if unsized:
+            # Sizes come from the upload metadata, the workflow cannot probe the files itself
+            log.warning(f"{len(unsized)} images have no size and are not batched", files=unsized)
 
-        for index, pdf_input in enumerate(input.files_upload, start=1):
-            log.info(f"Queue PdfWorkflow {index} for execution")
-            # Ensure child workflows are started and return an awaitable
-            task = workflow.child_execute(
-                PdfWorkflow, 
-                workflow_id=f"{parent_workflow_id}-pdf-{index}",
-                input=PdfWorkflowInput(
-                    file_upload=[pdf_input]
-                )
+        # Pack small images into multi-image OCR calls, a lone image goes through PdfWorkflow as usual
+        small_images = [i for i, file in enumerate(files) if _is_small_image(file, input.small_image_bytes)]
+        batches = [
+            small_images[start:start + input.image_batch_size]
+            for start in range(0, len(small_images), input.image_batch_size)
+        ]
+        batches = [batch for batch in batches if len(batch) > 1]
+        batched = {i for batch in batches for i in batch}
+        # Summaries of batched images share one cap, a job must not fan out to a whole batch of LLM calls
+        summary_slots = asyncio.Semaphore(input.max_concurrent_children)
+
+        async def summarise_image(text: str) -> str:
+            async with summary_slots:
+                return await summarise(summarise_prompt(text))
+
+        async def ocr_batch(batch: List[int]) -> List[str]:
+            log.info(f"Queue OCR batch of {len(batch)} images")
+            texts = await workflow.step(
+                torch_ocr_batch,
+                OcrBatchInput(files=[
+                    OcrInput(file_type=files[i]['type'], file_name=files[i]['name']) for i in batch
+                ]),
+                start_to_close_timeout=timedelta(seconds=120)
             )
-            # Wrap the task in an asyncio.ensure_future to ensure it's awaitable
-            tasks.append(asyncio.ensure_future(task))
+            return list(await asyncio.gather(*(summarise_image(text) for text in texts)))
+
+        async def child(index: int) -> List[str]:
+            log.info(f"Queue PdfWorkflow {index + 1} for execution")
+            result = await workflow.child_execute(
+                PdfWorkflow,
+                workflow_id=f"{parent_workflow_id}-pdf-{index + 1}",
+                input=PdfWorkflowInput(file_upload=[files[index]])
+            )
+            return [result]
+
+        # One job per batch and per remaining file, in upload order, so image batches
+        # and PDF children share the window and start together
+        jobs: List[Tuple[int, List[int], Callable[[], Awaitable[List[str]]]]] = [
+            (batch[0], batch, lambda batch=batch: ocr_batch(batch)) for batch in batches
+        ] + [
+            (index, [index], lambda index=index: child(index))
+            for index in range(len(files))
+            if index not in batched
+        ]
+        jobs.sort(key=lambda job: job[0])
 
-        # Await all tasks at once to run them in parallel
-        results = await asyncio.gather(*tasks)
+        def completed(job: int, result: List[str]) -> None:
+            log.info(f"Files {[i + 1 for i in jobs[job][1]]} completed", result=result)
 
-        for i, result in enumerate(results, start=1):
-            log.info(f"PdfWorkflow {i} completed", result=result)
+        job_results = await run_windowed(
+            [job for _, _, job in jobs],
+            input.max_concurrent_children,
+            on_result=completed,
+        )
+        results: List[Optional[str]] = [None] * len(files)
+        for (_, indices, _), summaries in zip(jobs, job_results):
+            for index, summary in zip(indices, summaries):
+                results[index] = summary
 
         return {
             "results": results
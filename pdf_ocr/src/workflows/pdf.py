@@ -1,38 +1,217 @@
-from restack_ai.workflow import workflow, import_functions, log
+from restack_ai.workflow import workflow, import_functions, log, workflow_info
+import asyncio
 from datetime import timedelta
 from pydantic import BaseModel,Field
-from typing import List
+from typing import List, Optional
+from .chunking import PAGE_BREAK, chunk_text
+from .fan_out import run_windowed
 
 with import_functions():
     from src.functions.torch_ocr import torch_ocr, OcrInput
+    from src.functions.ocr.progress import OcrProgress, PageProgress
     from src.functions.openai_chat import openai_chat, OpenAiChatInput
 
 class PdfWorkflowInput(BaseModel):
     file_upload: List[dict] = Field(files=True)
+    # Set when the file was already recognised, e.g. as part of an image batch
+    ocr_text: Optional[str] = None
+    # Longer OCR results are summarised chunk by chunk, then the summaries are combined
+    summary_chunk_tokens: int = 6000
+    # Chunk summaries requested at the same time
+    summary_fan_out: int = 8
+    # Start summarising complete chunks while later pages are still being recognised
+    summarise_early: bool = True
+    # A 300-page scan takes tens of minutes on CPU. torch_ocr heartbeats after every
+    # page window, so a stuck worker is still noticed long before the overall timeout.
+    ocr_timeout_seconds: int = 3600
+    ocr_heartbeat_timeout_seconds: int = 300
+
+class ProgressQuery(BaseModel):
+    # Only pages from this index on are returned, so clients can poll incrementally
+    from_page: int = 0
+    include_text: bool = True
+
+class PdfProgress(BaseModel):
+    # "recognising", "summarising" or "completed"
+    status: str
+    page_count: int
+    pages_done: int
+    pages: List[PageProgress]
+    ocr_elapsed_seconds: float
+    chunks_summarised: int
+
+async def summarise(user_content: str, system_content: Optional[str] = None) -> str:
+    return await workflow.step(
+        openai_chat,
+        OpenAiChatInput(
+            user_content=user_content,
+            system_content=system_content,
+            model="gpt-4o-mini"
+        ),
+        start_to_close_timeout=timedelta(seconds=120)
+    )
+
+def summarise_prompt(ocr_result: str) -> str:
+    return f"Make a summary of that PDF. Here is the OCR result: {ocr_result}"
 
 @workflow.defn()
 class PdfWorkflow:
+    def __init__(self) -> None:
+        self.status = "recognising"
+        self.pages: List[PageProgress] = []
+        self.page_count = 0
+        self.ocr_elapsed_seconds = 0.0
+        self.chunks_summarised = 0
+        # Every summary call of the run, early or not, takes one of `summary_fan_out` slots
+        self.summary_slots: Optional[asyncio.Semaphore] = None
+
+    @workflow.event
+    async def ocr_pages(self, progress: OcrProgress) -> int:
+        # Sent by torch_ocr after every page window. Only a contiguous run of pages
+        # is kept, so a lost update stops early summaries instead of skipping text.
+        for page in progress.pages:
+            if page.page == len(self.pages):
+                self.pages.append(page)
+        self.page_count = progress.page_count
+        self.ocr_elapsed_seconds = progress.elapsed_seconds
+        return len(self.pages)
+
+    @workflow.memory
+    def progress(self, query: ProgressQuery) -> PdfProgress:
+        # Read-only query: polling adds nothing to the history and still answers once the workflow closed
+        pages = self.pages[query.from_page:]
+        if not query.include_text:
+            pages = [page.model_copy(update={"text": ""}) for page in pages]
+        return PdfProgress(
+            status=self.status,
+            page_count=self.page_count,
+            pages_done=len(self.pages),
+            pages=pages,
+            ocr_elapsed_seconds=self.ocr_elapsed_seconds,
+            chunks_summarised=self.chunks_summarised,
+        )
+
     @workflow.run
     async def run(self, input: PdfWorkflowInput):
         log.info("PdfWorkflow started")
+        self.summary_slots = asyncio.Semaphore(input.summary_fan_out)
 
-        ocr_result = await workflow.step(
-            torch_ocr,
-            OcrInput(
-                file_type=input.file_upload[0]['type'],
-                file_name=input.file_upload[0]['name']
-            ),
-            start_to_close_timeout=timedelta(seconds=120)
-        )
+        # Chunks sealed while OCR was still running, and their summaries in flight
+        sealed: List[str] = []
+        early: List[asyncio.Future] = []
 
-        llm_result = await workflow.step(
-            openai_chat,
-            OpenAiChatInput(
-                user_content=f"Make a summary of that PDF. Here is the OCR result: {ocr_result}",
-                model="gpt-4o-mini"
-            ),
-            start_to_close_timeout=timedelta(seconds=120)
-        )
+        ocr_result = input.ocr_text
+        if ocr_result is None:
+            info = workflow_info()
+            ocr = asyncio.ensure_future(workflow.step(
+                torch_ocr,
+                OcrInput(
+                    file_type=input.file_upload[0]['type'],
+                    file_name=input.file_upload[0]['name'],
+                    progress_workflow_id=info.workflow_id,
+                    progress_run_id=info.run_id,
+                ),
+                start_to_close_timeout=timedelta(seconds=input.ocr_timeout_seconds),
+                schedule_to_close_timeout=timedelta(seconds=input.ocr_timeout_seconds),
+                heartbeat_timeout=timedelta(seconds=input.ocr_heartbeat_timeout_seconds),
+            ))
+            if input.summarise_early:
+                pages_seen = 0
+                while True:
+                    await workflow.condition(lambda: ocr.done() or len(self.pages) > pages_seen)
+                    if ocr.done():
+                        break
+                    pages_seen = len(self.pages)
+                    # Chunks are packed greedily, so all but the last one are final
+                    chunks = chunk_text(PAGE_BREAK.join(page.text for page in self.pages), input.summary_chunk_tokens)
+                    for chunk in chunks[len(sealed):-1]:
+                        log.info(f"Summarising chunk {len(sealed) + 1} while OCR continues", pages_done=pages_seen)
+                        early.append(asyncio.ensure_future(self.summarise_chunk(len(sealed), chunk)))
+                        sealed.append(chunk)
+            ocr_result = await ocr
+        self.reconcile_pages(ocr_result)
+
+        self.status = "summarising"
+        chunks = chunk_text(ocr_result, input.summary_chunk_tokens)
 
+        # Early summaries are kept for the chunks that match the final OCR result
+        reused = 0
+        if len(chunks) > 1:
+            while reused < len(sealed) and sealed[reused] == chunks[reused]:
+                reused += 1
+        for task in early[reused:]:
+            task.cancel()
+
+        if len(chunks) == 1:
+            llm_result = await self.summarise(summarise_prompt(ocr_result))
+        else:
+            llm_result = await self.map_reduce(chunks, input, list(await asyncio.gather(*early[:reused])))
+
+        self.status = "completed"
         log.info("PdfWorkflow completed")
         return llm_result
+
+    def reconcile_pages(self, ocr_result: str) -> None:
+        # The OCR result is authoritative. Pages whose `ocr_pages` update was lost, or
+        # that never had one, are filled in from it.
+        texts = ocr_result.split(PAGE_BREAK)
+        kept = 0
+        while kept < min(len(self.pages), len(texts)) and self.pages[kept].text == texts[kept]:
+            kept += 1
+        self.pages = self.pages[:kept] + [
+            PageProgress(page=index, text=text, source="ocr", elapsed_seconds=self.ocr_elapsed_seconds)
+            for index, text in enumerate(texts)
+            if index >= kept
+        ]
+        self.page_count = len(self.pages)
+
+    async def summarise(self, user_content: str, system_content: Optional[str] = None) -> str:
+        if self.summary_slots is None:
+            return await summarise(user_content, system_content)
+        async with self.summary_slots:
+            return await summarise(user_content, system_content)
+
+    async def summarise_chunk(self, index: int, chunk: str) -> str:
+        summary = await self.summarise(
+            f"Here is the OCR result of part {index + 1} of a PDF: {chunk}",
+            system_content="Summarise this part of a longer document. Keep names, figures and dates."
+        )
+        self.chunks_summarised += 1
+        return summary
+
+    async def map_reduce(self, chunks: List[str], input: PdfWorkflowInput, summaries: List[str]) -> str:
+        # Map: every chunk is summarised on its own, in parallel. `summaries` already
+        # covers the first chunks when they were summarised during OCR.
+        log.info(f"Summarising {len(chunks) - len(summaries)} of {len(chunks)} chunks")
+        summaries += await run_windowed(
+            [
+                lambda index=index, chunk=chunk: self.summarise_chunk(index, chunk)
+                for index, chunk in enumerate(chunks)
+                if index >= len(summaries)
+            ],
+            input.summary_fan_out,
+        )
+
+        # Reduce: combine summaries in groups that fit a chunk until one group is left
+        groups = chunk_text("\n\n".join(summaries), input.summary_chunk_tokens)
+        level = 1
+        # Stop early if grouping no longer shrinks the summaries
+        while 1 < len(groups) < len(summaries):
+            log.info(f"Combining {len(summaries)} summaries into {len(groups)} at level {level}")
+            summaries = await run_windowed(
+                [
+                    lambda group=group: self.summarise(
+                        f"Here are summaries of consecutive parts of a PDF: {group}",
+                        system_content="Merge these partial summaries into one. Keep names, figures and dates."
+                    )
+                    for group in groups
+                ],
+                input.summary_fan_out,
+            )
+            groups = chunk_text("\n\n".join(summaries), input.summary_chunk_tokens)
+            level += 1
+
+        return await self.summarise(
+            "Make a summary of that PDF. Here are summaries of its parts, in order: "
+            + "\n\n".join(groups)
+        )